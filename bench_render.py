@@ -0,0 +1,180 @@
+"""
+Renderer benchmark for the report formatter.
+
+Times VehicleIntelBot.format_intel_message against the original
+concatenating renderer over reports from the local cache table, and checks
+that both produce identical text. Does not start polling:
+
+    python bench_render.py
+    python bench_render.py --limit 500 --rounds 50
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, Any, List
+
+from bot import bot_instance
+
+
+def legacy_format_intel_message(report: Dict[str, Any]) -> str:
+    """The original concatenating renderer, kept as the byte-for-byte reference"""
+    if "error" in report:
+        return f"❌ *QUERY FAILED*\n\n{report['error']}\n\n💡 _Tip: Make sure the RC number is correct_"
+
+    meta = report["metadata"]
+    from_cache = " (Cached)" if meta.get("from_cache") else ""
+
+    message = "╔══════════════════════════════╗\n"
+    message += "║  🚗 *RC INFORMATION REPORT*  ║\n"
+    message += "╚══════════════════════════════╝\n\n"
+
+    # Metadata
+    message += f"🎯 *Target:* `{meta['target']}`{from_cache}\n"
+    message += f"🕐 *Generated:* {meta['timestamp']}\n"
+    if meta.get("stale"):
+        message += "⚠️ _Stale report - a fresh copy is being fetched_\n"
+    message += f"📊 *Confidence:* {meta['data_confidence']}\n"
+    message += "═" * 35 + "\n\n"
+
+    # 🚗 Ownership Details
+    message += "🚗 *OWNERSHIP DETAILS*\n"
+    message += "─" * 35 + "\n"
+    for key, value in report["ownership"].items():
+        if value and value != "N/A":
+            message += f"{key}: `{value}`\n"
+
+    # 🏢 RTO Information
+    if report["rto"].get("🏢 Registered RTO", "N/A") != "N/A":
+        message += "\n🏢 *RTO INFORMATION*\n"
+        message += "─" * 35 + "\n"
+        for key, value in report["rto"].items():
+            if value and value != "N/A":
+                message += f"{key}: `{value}`\n"
+
+    # 🧰 Vehicle Details
+    message += "\n🧰 *VEHICLE DETAILS*\n"
+    message += "─" * 35 + "\n"
+    for key, value in report["vehicle"].items():
+        if value and value != "N/A":
+            message += f"{key}: `{value}`\n"
+
+    # 📄 Insurance Information
+    message += "\n📄 *INSURANCE INFORMATION*\n"
+    message += "─" * 35 + "\n"
+    has_insurance_data = False
+    for key, value in report["insurance"].items():
+        if value and value != "N/A":
+            has_insurance_data = True
+            message += f"{key}: `{value}`\n"
+
+    if not has_insurance_data:
+        message += "⚠️ _No insurance information available_\n"
+
+    # Check for expired insurance warning
+    insurance_expiry = report["insurance"].get("🚫 Insurance Expiry In", "N/A")
+    if "expired" in str(insurance_expiry).lower() or "overdue" in str(insurance_expiry).lower():
+        message += "\n⚠️ *WARNING:* Insurance has expired! Renew immediately.\n"
+
+    # 🗓 Important Dates & Validity
+    message += "\n🗓 *IMPORTANT DATES & VALIDITY*\n"
+    message += "─" * 35 + "\n"
+    for key, value in report["dates"].items():
+        if value and value != "N/A":
+            message += f"{key}: `{value}`\n"
+
+    # 🛍 Other Information
+    message += "\n🛍 *OTHER INFORMATION*\n"
+    message += "─" * 35 + "\n"
+    has_other_data = False
+    for key, value in report["other"].items():
+        if value and value != "N/A":
+            has_other_data = True
+            message += f"{key}: `{value}`\n"
+
+    if not has_other_data:
+        message += "_No additional information_\n"
+
+    # 📁 NOC Details
+    noc_details = report["noc"].get("NOC Details", "N/A")
+    if noc_details and noc_details != "N/A":
+        message += "\n📁 *NOC DETAILS*\n"
+        message += "─" * 35 + "\n"
+        message += f"NOC Details: `{noc_details}`\n"
+
+    # 🪪 Basic Card Info (if different from main data)
+    message += "\n🪪 *BASIC CARD INFO*\n"
+    message += "─" * 35 + "\n"
+    has_card_data = False
+    for key, value in report["card_info"].items():
+        if value and value != "N/A" and key not in ["😀 Owner Name"]:
+            has_card_data = True
+            message += f"{key}: `{value}`\n"
+
+    if not has_card_data:
+        message += "_No additional card information_\n"
+
+    # 🚨 Security Alerts (Blacklist status)
+    blacklist = report["other"].get("🚫 Blacklist Status", "N/A")
+    if blacklist and blacklist != "N/A" and blacklist.lower() != "no":
+        message += "\n🚨 *SECURITY ALERT*\n"
+        message += "─" * 35 + "\n"
+        message += f"⚠️ *Blacklist Status:* `{blacklist}`\n"
+
+    message += "\n" + "═" * 35 + "\n"
+    message += "🚀 *Made by RC Info Bot*\n"
+    message += "📱 _Powered by VVVin API_\n"
+
+    return message
+
+
+def benchmark_renderer(reports: List[Dict[str, Any]], rounds: int = 200) -> Dict[str, Any]:
+    """Time format_intel_message against the legacy renderer and check they agree byte for byte"""
+    identical = all(
+        bot_instance.format_intel_message(report) == legacy_format_intel_message(report)
+        for report in reports
+    )
+    
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for report in reports:
+            legacy_format_intel_message(report)
+    legacy_time = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for report in reports:
+            bot_instance.format_intel_message(report)
+    template_time = time.perf_counter() - started
+    
+    renders = rounds * len(reports)
+    return {
+        "reports": len(reports),
+        "identical": identical,
+        "legacy_us": legacy_time / renders * 1e6,
+        "template_us": template_time / renders * 1e6,
+        "speedup": legacy_time / template_time if template_time else 0
+    }
+
+
+async def load_cached_reports(limit: int) -> List[Dict[str, Any]]:
+    """Decode up to `limit` reports from the cache table"""
+    rows = await bot_instance.storage.fetchall('SELECT response_data FROM cache LIMIT ?', (limit,))
+    return [bot_instance.decode_cache_entry(row[0]) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the report renderer against the legacy one")
+    parser.add_argument("--limit", type=int, default=100, help="cached reports to render")
+    parser.add_argument("--rounds", type=int, default=200, help="renders per report")
+    args = parser.parse_args()
+
+    reports = asyncio.run(load_cached_reports(args.limit))
+    result = benchmark_renderer(reports, args.rounds) if reports else {"reports": 0}
+    print(json.dumps(result, indent=2))
+    bot_instance.storage.close()
+
+
+if __name__ == "__main__":
+    main()
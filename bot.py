@@ -10,21 +10,32 @@ License: MIT
 """
 
 import logging
-import requests
 import json
 import time
+import zlib
+import base64
+import hashlib
+import math
+import random
 import sqlite3
 import os
 import re
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
+import queue
+from collections import OrderedDict, Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from typing import Dict, Any, Optional, List, Callable, Awaitable
 from io import BytesIO
+import aiohttp
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, filters, 
-    ContextTypes, CallbackQueryHandler, ConversationHandler
+    ContextTypes, CallbackQueryHandler, ConversationHandler, BaseRateLimiter
 )
 
 # Load environment variables from .env file
@@ -33,10 +44,77 @@ load_dotenv()
 # ===== CONFIGURATION =====
 BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
 API_BASE = "https://vvvin-ng.vercel.app/lookup?rc="
+# Equivalent lookup endpoints (comma-separated, RC number is appended); defaults to API_BASE
+UPSTREAM_ENDPOINTS = [url.strip() for url in os.getenv("UPSTREAM_ENDPOINTS", API_BASE).split(",") if url.strip()]
 ADMIN_IDS = list(map(int, os.getenv("ADMIN_IDS", "").split(","))) if os.getenv("ADMIN_IDS") else [8284333794]
 DATABASE_FILE = "vehicle_intel.db"
 MAX_QUERIES_PER_DAY = int(os.getenv("MAX_QUERIES_PER_DAY", "10"))
 CACHE_EXPIRY_HOURS = 24
+CACHE_MEMORY_MAX_ENTRIES = int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", "1000"))
+CACHE_STALE_WHILE_REVALIDATE = os.getenv("CACHE_STALE_WHILE_REVALIDATE", "false").lower() in ("1", "true", "yes")
+CACHE_MAX_STALE_HOURS = int(os.getenv("CACHE_MAX_STALE_HOURS", "6"))
+CACHE_FALLBACK_MAX_STALE_HOURS = int(os.getenv("CACHE_FALLBACK_MAX_STALE_HOURS", "72"))
+CACHE_SWEEP_INTERVAL_SECONDS = int(os.getenv("CACHE_SWEEP_INTERVAL_SECONDS", "900"))
+CACHE_SWEEP_BATCH_SIZE = 500
+CACHE_FORMAT_VERSION = 1
+CACHE_COMPRESSION_LEVEL = 6
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "3"))
+
+# Upstream HTTP client tuning
+HTTP_TIMEOUT_SECONDS = 20
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_KEEPALIVE_SECONDS = 30
+HTTP_DNS_CACHE_SECONDS = 300
+UPSTREAM_RATE_PER_SECOND = float(os.getenv("UPSTREAM_RATE_PER_SECOND", "2"))
+UPSTREAM_BURST = int(os.getenv("UPSTREAM_BURST", "5"))
+UPSTREAM_TOKEN_WAIT_SECONDS = float(os.getenv("UPSTREAM_TOKEN_WAIT_SECONDS", "5"))
+# Each this many seconds spent queued promotes an upstream call by one priority class
+UPSTREAM_AGING_SECONDS = float(os.getenv("UPSTREAM_AGING_SECONDS", "2"))
+# Upstream priority classes; lower is served first
+UPSTREAM_PRIORITY_PREMIUM = 0
+UPSTREAM_PRIORITY_FREE = 1
+UPSTREAM_PRIORITY_BATCH = 2
+# Total time a lookup may spend upstream, split across its attempts
+LOOKUP_DEADLINE_SECONDS = float(os.getenv("LOOKUP_DEADLINE_SECONDS", "8"))
+# Race a second request once the first outlives the observed p95 latency
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "true").lower() in ("1", "true", "yes")
+HEDGE_MIN_SAMPLES = 20
+BACKOFF_BASE_SECONDS = 1
+BACKOFF_MAX_SECONDS = 8
+
+# Upstream circuit breaker
+BREAKER_WINDOW = 20
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "10"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = 1
+# Endpoints left unused this long get one call so their health figures stay current
+ENDPOINT_RECHECK_SECONDS = 30
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+
+# SQLite storage tuning
+DB_READER_POOL_SIZE = int(os.getenv("DB_READER_POOL_SIZE", "4"))
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHE_SIZE_KB = 16384
+DB_MMAP_SIZE_BYTES = 128 * 1024 * 1024
+QUOTA_LEDGER_ENABLED = os.getenv("QUOTA_LEDGER_ENABLED", "true").lower() in ("1", "true", "yes")
+QUOTA_FLUSH_INTERVAL_SECONDS = int(os.getenv("QUOTA_FLUSH_INTERVAL_SECONDS", "30"))
+ANALYTICS_SKETCHES_ENABLED = os.getenv("ANALYTICS_SKETCHES_ENABLED", "false").lower() in ("1", "true", "yes")
+SKETCH_TOPK_CAPACITY = 64
+SKETCH_HLL_PRECISION = 12
+SKETCH_PERSIST_INTERVAL_SECONDS = 300
+LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv("LOG_FLUSH_INTERVAL_SECONDS", "2"))
+LOG_FLUSH_MAX_EVENTS = int(os.getenv("LOG_FLUSH_MAX_EVENTS", "200"))
+ADMIN_STATS_TTL_SECONDS = int(os.getenv("ADMIN_STATS_TTL_SECONDS", "30"))
+SEND_GLOBAL_PER_SECOND = float(os.getenv("SEND_GLOBAL_PER_SECOND", "25"))
+SEND_CHAT_PER_SECOND = float(os.getenv("SEND_CHAT_PER_SECOND", "1"))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "4"))
+SEND_GROUP_PER_MINUTE = 20
+SEND_MAX_RETRIES = 2
+# rate_limit_args values understood by SendScheduler; lower goes first
+SEND_PRIORITY_INTERACTIVE = 0
+SEND_PRIORITY_BULK = 1
 
 # Enable comprehensive logging
 logging.basicConfig(
@@ -55,22 +133,1197 @@ WAITING_RC, BATCH_MODE, WAITING_FEEDBACK = range(3)
 # RC Number validation pattern
 RC_PATTERN = re.compile(r'^[A-Z]{2}\d{1,2}[A-Z]{1,2}\d{1,4}$')
 
+# Hot statements whose query plans are verified at startup (see check_query_plans)
+SQL_USER_RECENT_QUERIES = '''
+    SELECT rc_number, timestamp, success 
+    FROM queries 
+    WHERE user_id = ? 
+    ORDER BY timestamp DESC 
+    LIMIT 5
+'''
+SQL_TOP_USERS = '''
+    SELECT user_id, username, queries_count 
+    FROM users 
+    ORDER BY queries_count DESC 
+    LIMIT 5
+'''
+
+# Admin dashboard aggregates read the incrementally maintained rollup tables
+# Closed days never change, so dashboard refreshes only re-read today's row
+SQL_QUERY_HISTORY_TOTALS = "SELECT COALESCE(SUM(queries), 0), COALESCE(SUM(successful), 0) FROM stats_daily WHERE day < ?"
+SQL_QUERIES_TODAY = "SELECT COALESCE(SUM(queries), 0), COALESCE(SUM(successful), 0) FROM stats_daily WHERE day = ?"
+SQL_ACTIVE_USERS_TODAY = "SELECT COUNT(*) FROM stats_user_daily WHERE day = ?"
+SQL_TOP_RCS_TODAY = "SELECT rc_number, queries FROM stats_rc_daily WHERE day = ? ORDER BY queries DESC LIMIT 3"
+SQL_FEEDBACK_SINCE = '''
+    SELECT f.id, f.user_id, u.username, f.message, f.timestamp
+    FROM feedback f
+    LEFT JOIN users u ON f.user_id = u.user_id
+    WHERE f.id > ?
+    ORDER BY f.id DESC
+    LIMIT 10
+'''
+SQL_TOP_RCS = '''
+    SELECT rc_number, queries 
+    FROM stats_rc_total 
+    ORDER BY queries DESC 
+    LIMIT 5
+'''
+
+# (name, statement, parameters, index the plan must use)
+QUERY_PLAN_EXPECTATIONS = [
+    ("user_recent_queries", SQL_USER_RECENT_QUERIES, (0,), "idx_queries_user_time"),
+    ("top_users", SQL_TOP_USERS, (), "idx_users_queries_count"),
+    ("query_history_totals", SQL_QUERY_HISTORY_TOTALS, ("",), "PRIMARY KEY"),
+    ("queries_today", SQL_QUERIES_TODAY, ("",), "PRIMARY KEY"),
+    ("active_users_today", SQL_ACTIVE_USERS_TODAY, ("",), "PRIMARY KEY"),
+    ("top_rcs_today", SQL_TOP_RCS_TODAY, ("",), "PRIMARY KEY"),
+    ("feedback_since", SQL_FEEDBACK_SINCE, (0,), "INTEGER PRIMARY KEY"),
+    ("top_rcs", SQL_TOP_RCS, (), "idx_stats_rc_total_queries"),
+]
+
+# ===== UPSTREAM HTTP CLIENT =====
+class UpstreamClient:
+    """Shared aiohttp client with a bounded keep-alive connection pool"""
+
+    def __init__(self, headers: Dict[str, str], pool_size: int = HTTP_POOL_SIZE):
+        self.headers = headers
+        self.pool_size = pool_size
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it lazily on the running event loop"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size,
+                keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+                ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+                use_dns_cache=True
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS)
+            )
+        return self._session
+
+    async def get_json(self, url: str) -> tuple[int, Any, Optional[float]]:
+        """GET a URL and return (status, decoded JSON body or None, Retry-After seconds or None)"""
+        session = self.get_session()
+        async with session.get(url) as response:
+            if response.status != 200:
+                return response.status, None, parse_retry_after(response.headers.get('Retry-After'))
+            return response.status, await response.json(content_type=None), None
+
+    async def close(self) -> None:
+        """Close the session and release pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given as delta-seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+def backoff_delay(attempt: int) -> float:
+    """Capped exponential backoff with jitter, so retrying callers spread out"""
+    return random.uniform(0.5, 1.0) * min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+
+# ===== UPSTREAM CIRCUIT BREAKER =====
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a sliding window of upstream calls.
+
+    Failed calls and calls slower than slow_call_seconds count against the
+    window. Once enough of them do, the breaker opens and callers fail fast
+    until open_seconds (or an upstream Retry-After) pass; then a limited
+    number of probe calls decide whether it closes or opens again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, name: str, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 error_rate: float = BREAKER_ERROR_RATE, slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+                 open_seconds: float = BREAKER_OPEN_SECONDS, probes: int = BREAKER_HALF_OPEN_PROBES):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.state = self.CLOSED
+        self.latency_ewma = 0.0
+        self._outcomes: deque = deque(maxlen=window)
+        self._latencies: deque = deque(maxlen=100)
+        self._open_until = 0.0
+        self._probes_in_flight = 0
+
+    def _transition(self, state: str, reason: str) -> None:
+        """Switch state and log the change"""
+        if state == self.state:
+            return
+        previous, self.state = self.state, state
+        if state == self.CLOSED:
+            self._outcomes.clear()
+            logger.info(f"✅ Circuit {self.name}: {previous} → {state} ({reason})")
+        else:
+            logger.warning(f"🔌 Circuit {self.name}: {previous} → {state} ({reason})")
+
+    def _open(self, seconds: float, reason: str) -> None:
+        """Open (or keep open) for at least `seconds`"""
+        self._open_until = max(self._open_until, time.monotonic() + seconds)
+        self._transition(self.OPEN, reason)
+
+    def before_call(self) -> Optional[float]:
+        """Admit a call (None) or return seconds until the upstream may be tried again"""
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now < self._open_until:
+                return self._open_until - now
+            self._transition(self.HALF_OPEN, "cool-down elapsed, probing")
+        if self.state == self.HALF_OPEN:
+            if self._probes_in_flight >= self.probes:
+                return 1.0
+            self._probes_in_flight += 1
+        return None
+
+    def cancel(self) -> None:
+        """Give back an admitted call that never reached the upstream"""
+        if self.state == self.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record(self, success: bool, latency: float) -> None:
+        """Feed back the outcome of an admitted call"""
+        # Only successes say how fast the upstream answers; a fast failure is no credit
+        if success:
+            self.latency_ewma = latency if not self.latency_ewma else 0.8 * self.latency_ewma + 0.2 * latency
+            self._latencies.append(latency)
+        healthy = success and latency <= self.slow_call_seconds
+        
+        if self.state == self.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if healthy:
+                self._transition(self.CLOSED, "probe succeeded")
+            else:
+                self._open(self.open_seconds, "probe failed")
+            return
+        
+        self._outcomes.append(healthy)
+        failures = self._outcomes.count(False)
+        if (self.state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.error_rate):
+            self._open(self.open_seconds, f"{failures}/{len(self._outcomes)} recent calls failed or were slow")
+
+    def p95(self, min_samples: int = HEDGE_MIN_SAMPLES) -> Optional[float]:
+        """95th percentile latency of recent successful calls, once enough were seen"""
+        if len(self._latencies) < min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def hold_off(self, seconds: float) -> None:
+        """Honor an upstream Retry-After: no caller reaches the upstream until it expires"""
+        self._open(seconds, f"upstream asked to retry after {seconds:.0f}s")
+
+    def failure_rate(self) -> float:
+        """Share of failed or slow calls in the window, 0..1"""
+        calls = len(self._outcomes)
+        return self._outcomes.count(False) / calls if calls else 0.0
+
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets a probe through (0 when not open)"""
+        return max(0.0, self._open_until - time.monotonic()) if self.state == self.OPEN else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Current state and recent health for the admin dashboard"""
+        return {
+            "state": self.state,
+            "error_rate": self.failure_rate() * 100,
+            "latency_ms": self.latency_ewma * 1000,
+            "p95_ms": (self.p95(min_samples=1) or 0) * 1000,
+            "retry_in": self.retry_in()
+        }
+
+# ===== UPSTREAM ENDPOINT POOL =====
+class UpstreamEndpoint:
+    """One equivalent lookup endpoint with its own breaker and health figures"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.name = urlparse(base_url).netloc or base_url
+        self.breaker = CircuitBreaker(self.name)
+        self.last_used = 0.0
+
+    def url_for(self, rc_clean: str) -> str:
+        """Lookup URL for an RC number"""
+        return f"{self.base_url}{rc_clean}"
+
+    def health_score(self) -> tuple:
+        """Lower is better: (recent error rate, EWMA latency of successful calls).
+
+        Error rate comes first, so any failing endpoint ranks behind a clean one.
+        """
+        return (self.breaker.failure_rate(), self.breaker.latency_ewma)
+
+class EndpointPool:
+    """Routes each upstream call to the healthiest endpoint its breaker admits.
+
+    An endpoint whose breaker opens is ejected from rotation. Once its
+    cool-down passes it is ranked first so a single probe call can reinstate
+    it. Endpoints that lost on score are re-checked with one call after
+    ENDPOINT_RECHECK_SECONDS, so a recovered endpoint can win again.
+    """
+
+    def __init__(self, base_urls: List[str]):
+        self.endpoints = [UpstreamEndpoint(url) for url in base_urls]
+
+    def acquire(self, avoid: Optional[UpstreamEndpoint] = None) -> tuple:
+        """Admit a call on the best endpoint, preferring one other than `avoid`.
+
+        Returns (endpoint, 0) or (None, seconds until any endpoint may be tried).
+        """
+        now = time.monotonic()
+        
+        def rank(endpoint: UpstreamEndpoint) -> tuple:
+            breaker = endpoint.breaker
+            if breaker.state == CircuitBreaker.OPEN:
+                probe_due = breaker.retry_in() == 0
+            else:
+                probe_due = now - endpoint.last_used > ENDPOINT_RECHECK_SECONDS
+            return (endpoint is avoid, not probe_due, endpoint.health_score())
+        
+        waits = []
+        for endpoint in sorted(self.endpoints, key=rank):
+            wait = endpoint.breaker.before_call()
+            if wait is None:
+                endpoint.last_used = now
+                return endpoint, 0.0
+            waits.append(wait)
+        return None, min(waits)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-endpoint health for the admin dashboard"""
+        return [{"name": endpoint.name, **endpoint.breaker.stats()} for endpoint in self.endpoints]
+
+# ===== IN-MEMORY CACHE =====
+class TTLCache:
+    """Size-bounded LRU cache whose entries also expire after a TTL"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a live entry and mark it most recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Insert or refresh an entry, evicting least recently used ones past capacity"""
+        if self.max_entries <= 0:
+            return
+        
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: str) -> None:
+        """Drop an entry if present"""
+        self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters used to size the cache against the memory budget"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": (self.hits / lookups * 100) if lookups > 0 else 0
+        }
+
+# ===== RATE LIMITING =====
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second, holding up to `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def try_take(self) -> float:
+        """Take one token; return 0 on success, else seconds until one is available"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def take(self) -> None:
+        """Wait until a token is available and take it"""
+        wait = self.try_take()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.try_take()
+
+    async def acquire(self, timeout: float) -> bool:
+        """Take a token, waiting at most `timeout` seconds; False if none came in time"""
+        deadline = time.monotonic() + timeout
+        wait = self.try_take()
+        while wait > 0:
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+            wait = self.try_take()
+        return True
+
+class UpstreamScheduler:
+    """Hands out upstream rate-limit tokens in priority order.
+
+    While callers are queued, each token goes to the waiter with the lowest
+    priority class after aging: every aging_seconds spent waiting lowers a
+    waiter's effective class by one, so batch work still gets through under
+    sustained interactive load. Wait times are tracked per class.
+    """
+
+    CLASS_NAMES = ("premium", "free", "batch")
+
+    def __init__(self, bucket: TokenBucket, aging_seconds: float = UPSTREAM_AGING_SECONDS):
+        self.bucket = bucket
+        self.aging_seconds = aging_seconds
+        self._waiters: List[tuple] = []
+        self._pump: Optional[asyncio.Task] = None
+        self._waits = {name: {"granted": 0, "total": 0.0, "max": 0.0, "timeouts": 0} for name in self.CLASS_NAMES}
+
+    def _record(self, priority: int, waited: Optional[float]) -> None:
+        """Account one grant (with its wait) or one timeout (waited is None)"""
+        stats = self._waits[self.CLASS_NAMES[priority]]
+        if waited is None:
+            stats["timeouts"] += 1
+            return
+        stats["granted"] += 1
+        stats["total"] += waited
+        stats["max"] = max(stats["max"], waited)
+
+    async def acquire(self, priority: int, timeout: float) -> bool:
+        """Wait at most `timeout` seconds for an upstream token; False if none was granted"""
+        if not self._waiters and self.bucket.try_take() == 0:
+            self._record(priority, 0.0)
+            return True
+        
+        enqueued = time.monotonic()
+        waiter = (priority, enqueued, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        if self._pump is None:
+            self._pump = asyncio.create_task(self._run())
+        
+        try:
+            await asyncio.wait({waiter[2]}, timeout=timeout)
+        except asyncio.CancelledError:
+            # A cancelled caller must not leave a waiter behind to be granted a token
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            waiter[2].cancel()
+            raise
+        if waiter[2].done() and not waiter[2].cancelled():
+            self._record(priority, time.monotonic() - enqueued)
+            return True
+        
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+        waiter[2].cancel()
+        self._record(priority, None)
+        return False
+
+    def try_acquire_now(self) -> bool:
+        """Take a token only if one is free and nobody is queued for it"""
+        return not self._waiters and self.bucket.try_take() == 0
+
+    async def _run(self) -> None:
+        """Grant tokens to the best-ranked waiter as the bucket refills"""
+        try:
+            while True:
+                # Waiters whose future is already settled must not consume a token
+                self._waiters[:] = [w for w in self._waiters if not w[2].done()]
+                if not self._waiters:
+                    break
+                wait = self.bucket.try_take()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                now = time.monotonic()
+                best = min(self._waiters, key=lambda w: (w[0] - (now - w[1]) / self.aging_seconds, w[1]))
+                self._waiters.remove(best)
+                best[2].set_result(True)
+        finally:
+            self._pump = None
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-class queue wait figures for the admin dashboard"""
+        return {
+            name: {
+                "granted": s["granted"],
+                "avg_ms": s["total"] / s["granted"] * 1000 if s["granted"] else 0,
+                "max_ms": s["max"] * 1000,
+                "timeouts": s["timeouts"]
+            }
+            for name, s in self._waits.items()
+        }
+
+class SendScheduler(BaseRateLimiter[int]):
+    """PTB rate limiter that paces every outbound chat request.
+
+    Requests wait for their chat's bucket, then for the global bucket, where
+    interactive sends go ahead of bulk ones. rate_limit_args is the priority
+    (SEND_PRIORITY_INTERACTIVE when omitted). A RetryAfter pauses all sends
+    for the requested time before the request is retried.
+    """
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_PER_SECOND, chat_rate: float = SEND_CHAT_PER_SECOND,
+                 chat_burst: int = SEND_CHAT_BURST, max_retries: int = SEND_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        # Idle chats refill completely well within the TTL, so eviction loses nothing
+        self._chats = TTLCache(10000, 60)
+        self._waiting: Counter = Counter()
+        self._paused_until = 0.0
+
+    async def initialize(self) -> None:
+        """Nothing to set up; buckets are created on demand"""
+
+    async def shutdown(self) -> None:
+        """Nothing to release"""
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        """Bucket for one chat; groups get Telegram's stricter per-minute budget"""
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(SEND_GROUP_PER_MINUTE / 60, 3)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        self._chats.set(chat_id, bucket)
+        return bucket
+
+    async def _take_global(self, priority: int) -> None:
+        """Wait for a global token, yielding to any higher-priority waiter"""
+        self._waiting[priority] += 1
+        try:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0:
+                    if any(count for level, count in self._waiting.items() if level < priority):
+                        wait = 1 / self._global.rate
+                    else:
+                        wait = self._global.try_take()
+                        if wait == 0:
+                            return
+                await asyncio.sleep(wait)
+        finally:
+            self._waiting[priority] -= 1
+
+    async def process_request(self, callback: Callable[..., Awaitable], args: Any, kwargs: Dict[str, Any],
+                              endpoint: str, data: Dict[str, Any], rate_limit_args: Optional[int]) -> Any:
+        """Send once chat and global capacity allow, retrying after flood waits"""
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            # getUpdates, answerCallbackQuery and the like are not chat sends
+            return await callback(*args, **kwargs)
+        
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        priority = SEND_PRIORITY_INTERACTIVE if rate_limit_args is None else rate_limit_args
+        
+        for attempt in range(self.max_retries + 1):
+            await self._chat_bucket(chat_id).take()
+            await self._take_global(priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = float(e.retry_after)
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(f"⏳ Flood limit on {endpoint}, pausing sends for {delay:.0f}s")
+
+# ===== STREAMING ANALYTICS =====
+class SpaceSaving:
+    """Space-Saving heavy-hitter sketch: approximate top-K in constant memory"""
+
+    def __init__(self, capacity: int = SKETCH_TOPK_CAPACITY):
+        self.capacity = capacity
+        # item -> [count, overestimation error]
+        self.counters: Dict[str, List[int]] = {}
+
+    def add(self, item: str) -> None:
+        """Count one occurrence, replacing the smallest counter when full"""
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += 1
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [1, 0]
+        else:
+            victim = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + 1, floor]
+
+    def top(self, n: int) -> List[tuple]:
+        """Return up to n (item, estimated count) pairs, highest first"""
+        ranked = sorted(self.counters.items(), key=lambda pair: pair[1][0], reverse=True)
+        return [(item, count) for item, (count, _error) in ranked[:n]]
+
+    def to_state(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "counters": self.counters}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "SpaceSaving":
+        sketch = cls(state["capacity"])
+        sketch.counters = {item: list(counter) for item, counter in state["counters"].items()}
+        return sketch
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with 2^precision one-byte registers"""
+
+    def __init__(self, precision: int = SKETCH_HLL_PRECISION, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+
+    def add(self, item: str) -> None:
+        """Observe an item"""
+        hashed = int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = hashed >> (64 - self.precision)
+        remainder = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        """Estimate the number of distinct items observed"""
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            # Small-range correction (linear counting)
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+
+class AnalyticsSketches:
+    """Live top-K RCs/users and distinct users today, updated from the logging path"""
+
+    def __init__(self):
+        self.top_rcs = SpaceSaving()
+        self.top_users = SpaceSaving()
+        self.day = datetime.utcnow().date().isoformat()
+        self.users_today = HyperLogLog()
+
+    def observe(self, user_id: int, rc_number: str) -> None:
+        """Record one logged query"""
+        today = datetime.utcnow().date().isoformat()
+        if today != self.day:
+            self.day = today
+            self.users_today = HyperLogLog()
+        
+        self.top_rcs.add(rc_number)
+        self.top_users.add(str(user_id))
+        self.users_today.add(str(user_id))
+
+    def snapshot(self, n: int = 5) -> Dict[str, Any]:
+        """Approximate dashboard figures"""
+        active_today = self.users_today.count() if self.day == datetime.utcnow().date().isoformat() else 0
+        return {
+            "active_today": active_today,
+            "top_rcs": self.top_rcs.top(n),
+            "top_users": [(int(user_id), count) for user_id, count in self.top_users.top(n)]
+        }
+
+    def to_bytes(self) -> bytes:
+        """Serialize all sketch state for persistence"""
+        state = {
+            "top_rcs": self.top_rcs.to_state(),
+            "top_users": self.top_users.to_state(),
+            "day": self.day,
+            "users_today": base64.b64encode(bytes(self.users_today.registers)).decode('ascii')
+        }
+        return zlib.compress(json.dumps(state, separators=(',', ':')).encode('utf-8'))
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "AnalyticsSketches":
+        state = json.loads(zlib.decompress(blob))
+        sketches = cls()
+        sketches.top_rcs = SpaceSaving.from_state(state["top_rcs"])
+        sketches.top_users = SpaceSaving.from_state(state["top_users"])
+        sketches.day = state["day"]
+        sketches.users_today = HyperLogLog(registers=base64.b64decode(state["users_today"]))
+        return sketches
+
+# ===== REQUEST COALESCING =====
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one shared task"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Await the in-flight call for key, starting one if none is running"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        
+        # Shield so one waiter being cancelled does not cancel the shared call;
+        # errors and cancellation of the shared call still reach every waiter
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        """Drop a finished call and consume its exception if every waiter left"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+# ===== STORAGE LAYER =====
+class Storage:
+    """Long-lived SQLite connections (one writer, N readers) driven from worker threads"""
+
+    def __init__(self, path: str, readers: int = DB_READER_POOL_SIZE):
+        self.path = path
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._read_executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        # The writer is opened first so WAL mode is in place before any reader attaches
+        self._writer = self._connect()
+        self._readers: queue.Queue = queue.Queue()
+        for _ in range(readers):
+            self._readers.put(self._connect())
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection with the shared pragma profile"""
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE_BYTES}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+        return conn
+
+    def _run_write(self, fn: Callable, *args) -> Any:
+        """Run fn(conn, *args) on the writer connection inside one transaction"""
+        with self._writer:
+            return fn(self._writer, *args)
+
+    def _run_read(self, fn: Callable, *args) -> Any:
+        """Run fn(conn, *args) on a pooled reader connection"""
+        conn = self._readers.get()
+        try:
+            return fn(conn, *args)
+        finally:
+            self._readers.put(conn)
+
+    def write_sync(self, fn: Callable, *args) -> Any:
+        """Blocking write for use before the event loop is running"""
+        return self._write_executor.submit(self._run_write, fn, *args).result()
+
+    async def write(self, fn: Callable, *args) -> Any:
+        """Run a write transaction on the dedicated writer thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_executor, self._run_write, fn, *args)
+
+    async def read(self, fn: Callable, *args) -> Any:
+        """Run a read on one of the reader threads"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._run_read, fn, *args)
+
+    async def execute(self, sql: str, params: tuple = ()) -> None:
+        """Execute a single write statement"""
+        await self.write(lambda conn: conn.execute(sql, params))
+
+    async def fetchone(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        """Fetch a single row"""
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """Fetch all rows"""
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    def close(self) -> None:
+        """Wait for queued work and close every connection"""
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        self._writer.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+# ===== QUOTA LEDGER =====
+def quota_state(result: Optional[tuple]) -> tuple[bool, int]:
+    """Turn a (queries_today, is_premium, is_banned) row into (has_quota, remaining)"""
+    if not result:
+        return True, MAX_QUERIES_PER_DAY
+    
+    queries_today, is_premium, is_banned = result
+    
+    if is_banned:
+        return False, 0
+    
+    # Premium users have unlimited queries
+    if is_premium:
+        return True, -1
+    
+    remaining = MAX_QUERIES_PER_DAY - queries_today
+    return remaining > 0, remaining
+
+class QuotaLedger:
+    """In-process per-user quota state, authoritative for the current day.
+
+    Entries are loaded lazily from the users table, updated in memory on every
+    check and consume, and written back by flush(). Only valid while a single
+    bot process owns the database.
+    """
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._loads = SingleFlight()
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    async def _load(self, user_id: int) -> Dict[str, Any]:
+        """Build a ledger entry from the persisted user row"""
+        today = datetime.now().date().isoformat()
+        row = await self.storage.fetchone('''
+            SELECT queries_today, last_query_date, is_premium, is_banned
+            FROM users WHERE user_id = ?
+        ''', (user_id,))
+        queries_today, last_query_date, is_premium, is_banned = row or (0, None, False, False)
+        return {
+            "day": today,
+            "used": queries_today if last_query_date == today else 0,
+            "is_premium": bool(is_premium),
+            "is_banned": bool(is_banned),
+            "pending": 0,
+            "profile": None,
+            "last_seen": None,
+            "dirty": False
+        }
+
+    async def _entry(self, user_id: int) -> Dict[str, Any]:
+        """Return the user's entry, loading it once and rolling it over at midnight"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            loaded = await self._loads.do(str(user_id), lambda: self._load(user_id))
+            entry = self._entries.setdefault(user_id, loaded)
+        
+        today = datetime.now().date().isoformat()
+        if entry["day"] != today:
+            entry["day"] = today
+            entry["used"] = 0
+        return entry
+
+    def peek(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Return the loaded entry for a user without touching the database"""
+        return self._entries.get(user_id)
+
+    async def check(self, user_id: int) -> tuple[bool, int]:
+        """Dictionary-lookup quota check"""
+        entry = await self._entry(user_id)
+        return quota_state((entry["used"], entry["is_premium"], entry["is_banned"]))
+
+    async def consume(self, user_id: int, username: str, first_name: str, last_name: str,
+                      units: int = 1) -> tuple[bool, int]:
+        """Check and consume quota units; no await separates the check from the update"""
+        entry = await self._entry(user_id)
+        if entry["is_banned"]:
+            return False, 0
+        if not entry["is_premium"] and entry["used"] + units > MAX_QUERIES_PER_DAY:
+            return False, max(0, MAX_QUERIES_PER_DAY - entry["used"])
+        
+        entry["used"] += units
+        entry["pending"] += units
+        entry["profile"] = (username, first_name, last_name)
+        entry["last_seen"] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        entry["dirty"] = True
+        return True, -1 if entry["is_premium"] else MAX_QUERIES_PER_DAY - entry["used"]
+
+    def apply_status(self, user_id: int, is_premium: Optional[bool] = None,
+                     is_banned: Optional[bool] = None) -> None:
+        """Reflect an admin status change immediately"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        if not entry["dirty"]:
+            # Nothing unsaved, so simply reload on next access
+            del self._entries[user_id]
+            return
+        if is_premium is not None:
+            entry["is_premium"] = is_premium
+        if is_banned is not None:
+            entry["is_banned"] = is_banned
+
+    async def flush(self) -> None:
+        """Persist consumed units and today's counters for every dirty entry"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        
+        async with self._flush_lock:
+            batch = []
+            for user_id, entry in self._entries.items():
+                if entry["dirty"]:
+                    batch.append((user_id, entry, entry["pending"]))
+                    entry["pending"] = 0
+                    entry["dirty"] = False
+            
+            if batch:
+                rows = [
+                    (user_id, *entry["profile"], pending, entry["used"], entry["day"], entry["last_seen"])
+                    for user_id, entry, pending in batch
+                ]
+                try:
+                    await self.storage.write(lambda conn: conn.executemany('''
+                        INSERT INTO users 
+                        (user_id, username, first_name, last_name, queries_count, queries_today, last_query_date, last_seen)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            username = excluded.username,
+                            first_name = excluded.first_name,
+                            last_name = excluded.last_name,
+                            queries_count = queries_count + excluded.queries_count,
+                            queries_today = excluded.queries_today,
+                            last_query_date = excluded.last_query_date,
+                            last_seen = excluded.last_seen
+                    ''', rows))
+                except Exception as e:
+                    logger.error(f"❌ Failed to persist quota ledger: {str(e)}")
+                    for user_id, entry, pending in batch:
+                        entry["pending"] += pending
+                        entry["dirty"] = True
+                    return
+            
+            # Clean entries from earlier days are reloaded on demand
+            today = datetime.now().date().isoformat()
+            for user_id in [uid for uid, entry in self._entries.items()
+                            if not entry["dirty"] and entry["day"] != today]:
+                del self._entries[user_id]
+
+# ===== WRITE-BEHIND LOGGING =====
+class WriteBehindLog:
+    """Buffers log events in memory and writes them in one transaction per flush"""
+
+    def __init__(self, storage: Storage, flush_fn: Callable[[sqlite3.Connection, List[tuple]], None],
+                 interval: float = LOG_FLUSH_INTERVAL_SECONDS, max_events: int = LOG_FLUSH_MAX_EVENTS):
+        self.storage = storage
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_events = max_events
+        self._pending: List[tuple] = []
+        self._lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def add(self, event: tuple) -> None:
+        """Enqueue an event; the flusher is started lazily on the running loop"""
+        self._pending.append(event)
+        if self._task is None and not self._closing:
+            self._lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        if len(self._pending) >= self.max_events:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        """Flush every interval, or sooner once max_events are pending"""
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write all pending events in a single transaction"""
+        if not self._pending:
+            return
+        
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            try:
+                await self.storage.write(self.flush_fn, batch)
+            except Exception as e:
+                # Keep the events for the next flush rather than dropping them
+                logger.error(f"❌ Failed to flush {len(batch)} log events: {str(e)}")
+                self._pending[:0] = batch
+
+    async def close(self) -> None:
+        """Stop the flusher and drain everything still pending"""
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            await self.flush()
+
+# ===== MESSAGE CHUNKING =====
+# Telegram counts message length in UTF-16 code units
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Longest first, so ``` is not read as three inline code markers
+MARKDOWN_ENTITY_MARKERS = ("```", "`", "*", "_")
+
+def telegram_length(text: str) -> int:
+    """Length of text as Telegram measures it"""
+    return len(text.encode('utf-16-le')) // 2
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> tuple:
+    """Split Markdown into as few messages as possible without breaking entities.
+
+    Whole lines are packed greedily, so sections stay together whenever they
+    fit. Entities may span lines (a ``` block usually does): a chunk edge that
+    would fall inside one moves back to the last line outside any entity if
+    that keeps the chunk at least half full, and otherwise the entity is
+    closed at the end of the chunk and reopened at the start of the next.
+    Only a single oversized line is cut inside.
+    """
+    if telegram_length(text) <= limit:
+        return (text,)
+    
+    # (separator, text, entity open before, entity open after) per piece
+    pieces = []
+    open_marker = ""
+    for line in text.split("\n"):
+        for i, (piece, before, after) in enumerate(_split_line(line, open_marker, limit)):
+            pieces.append(("\n" if i == 0 else "", piece, before, after))
+        open_marker = pieces[-1][3]
+    return tuple(_pack_pieces(pieces, limit))
+
+def _reopen(marker: str) -> str:
+    """Text that reopens an entity at the start of a chunk"""
+    # A word right after ``` would be read as the block's language
+    return marker + "\n" if marker == "```" else marker
+
+def _markdown_tokens(text: str, open_marker: str = "", start: int = 0):
+    """Yield (end index, entity open there) after each Markdown token of text"""
+    i = start
+    while i < len(text):
+        if open_marker:
+            # Inside an entity only its own closing marker is special
+            closing = text.startswith(open_marker, i)
+            step = len(open_marker) if closing else 1
+            open_marker = "" if closing else open_marker
+        elif text[i] == "\\":
+            step = 2
+        else:
+            marker = next((m for m in MARKDOWN_ENTITY_MARKERS if text.startswith(m, i)), "")
+            step, open_marker = max(len(marker), 1), marker
+        i = min(i + step, len(text))
+        yield i, open_marker
+
+def _pack_pieces(pieces: List[tuple], limit: int) -> List[str]:
+    """Greedily join pieces (each within the limit) into as few chunks as fit"""
+    chunks = []
+    group, lengths = [], []
+    
+    def emit(count: int) -> None:
+        nonlocal group, lengths
+        body = group[0][1] + "".join(separator + text for separator, text, _, _ in group[1:count])
+        # Blank lines left at a chunk edge would only be trimmed by Telegram
+        body = body.strip("\n")
+        if body:
+            chunks.append(_reopen(group[0][2]) + body + group[count - 1][3])
+        rest = group[count:]
+        group, lengths = [], []
+        for piece in rest:
+            add(piece)
+    
+    def add(piece: tuple) -> None:
+        separator, text = ("", piece[1]) if not group else piece[:2]
+        lengths.append((lengths[-1] if lengths else 0) + telegram_length(separator + text))
+        group.append(piece)
+    
+    for piece in pieces:
+        separator, text, before, after = piece
+        while group:
+            if telegram_length(_reopen(group[0][2])) + lengths[-1] + telegram_length(separator + text + after) <= limit:
+                break
+            cut = len(group)
+            if before:
+                # Prefer moving the edge back out of the entity over splitting it
+                clean = next((k for k in range(len(group) - 1, 0, -1) if not group[k][2]), 0)
+                if clean and lengths[clean - 1] >= limit // 2:
+                    cut = clean
+            emit(cut)
+        add(piece)
+    if group:
+        emit(len(group))
+    return chunks
+
+def _split_line(line: str, open_marker: str, limit: int) -> List[tuple]:
+    """Cut a line into (text, entity open before, entity open after) pieces that fit a chunk.
+
+    Cuts prefer spaces outside any Markdown entity. If no such space fits,
+    the line is cut hard and an entity open at that point is closed and
+    reopened around the cut when the pieces are packed.
+    """
+    end_marker = open_marker
+    for _end, end_marker in _markdown_tokens(line, open_marker):
+        pass
+    # Room to reopen and close the longest marker around the piece
+    budget = limit - len(_reopen(MARKDOWN_ENTITY_MARKERS[0])) - len(MARKDOWN_ENTITY_MARKERS[0])
+    pieces = []
+    start, before = 0, open_marker
+    while telegram_length(_reopen(before) + line[start:] + end_marker) > limit:
+        units, space_units = 0, 0
+        space_cut, hard_cut, hard_marker = 0, start, before
+        for end, marker in _markdown_tokens(line, before, start):
+            units += telegram_length(line[hard_cut:end])
+            if units > budget:
+                break
+            hard_cut, hard_marker = end, marker
+            if not marker and line[end - 1] == " ":
+                space_cut, space_units = end, units
+        
+        # A space near the start would waste a message; cut hard instead
+        if space_units > budget // 2:
+            pieces.append((line[start:space_cut], before, ""))
+            start, before = space_cut, ""
+        else:
+            pieces.append((line[start:hard_cut], before, hard_marker))
+            start, before = hard_cut, hard_marker
+    pieces.append((line[start:], before, end_marker))
+    return pieces
+
+# ===== REPORT TEMPLATE =====
+# Bump whenever rendered output or its chunking changes so memoized renders are dropped
+RENDERER_VERSION = 3
+
+# Fixed fragments of format_intel_message, built once at import
+REPORT_RULE = "─" * 35 + "\n"
+REPORT_DOUBLE_RULE = "═" * 35 + "\n"
+REPORT_HEADER = (
+    "╔══════════════════════════════╗\n"
+    "║  🚗 *RC INFORMATION REPORT*  ║\n"
+    "╚══════════════════════════════╝\n\n"
+)
+REPORT_STALE_LINE = "⚠️ _Stale report - a fresh copy is being fetched_\n"
+REPORT_OWNERSHIP_HEADING = REPORT_DOUBLE_RULE + "\n🚗 *OWNERSHIP DETAILS*\n" + REPORT_RULE
+REPORT_RTO_HEADING = "\n🏢 *RTO INFORMATION*\n" + REPORT_RULE
+REPORT_VEHICLE_HEADING = "\n🧰 *VEHICLE DETAILS*\n" + REPORT_RULE
+REPORT_INSURANCE_HEADING = "\n📄 *INSURANCE INFORMATION*\n" + REPORT_RULE
+REPORT_INSURANCE_WARNING = "\n⚠️ *WARNING:* Insurance has expired! Renew immediately.\n"
+REPORT_DATES_HEADING = "\n🗓 *IMPORTANT DATES & VALIDITY*\n" + REPORT_RULE
+REPORT_OTHER_HEADING = "\n🛍 *OTHER INFORMATION*\n" + REPORT_RULE
+REPORT_NOC_HEADING = "\n📁 *NOC DETAILS*\n" + REPORT_RULE
+REPORT_CARD_HEADING = "\n🪪 *BASIC CARD INFO*\n" + REPORT_RULE
+REPORT_SECURITY_HEADING = "\n🚨 *SECURITY ALERT*\n" + REPORT_RULE
+REPORT_FOOTER = "\n" + REPORT_DOUBLE_RULE + "🚀 *Made by RC Info Bot*\n📱 _Powered by VVVin API_\n"
+
+def append_report_fields(parts: List[str], fields: Dict[str, Any], skip: str = "") -> bool:
+    """Append one `key: value` line per populated field; True if any were written"""
+    count = len(parts)
+    for key, value in fields.items():
+        if value and value != "N/A" and key != skip:
+            parts.append(f"{key}: `{value}`\n")
+    return len(parts) > count
+
 class VehicleIntelBot:
     """Professional Vehicle Intelligence Bot with advanced features"""
     
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.http = UpstreamClient({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'application/json',
             'Accept-Language': 'en-US,en;q=0.9',
         })
+        self.storage = Storage(DATABASE_FILE)
+        # Hot reports are served from memory; the SQLite cache table is the second tier
+        self.memory_cache = TTLCache(CACHE_MEMORY_MAX_ENTRIES, CACHE_EXPIRY_HOURS * 3600)
+        # Rendered Markdown per report version, so hot cache hits skip formatting
+        self.render_cache = TTLCache(CACHE_MEMORY_MAX_ENTRIES, CACHE_EXPIRY_HOURS * 3600)
+        self.inflight = SingleFlight()
+        self.upstreams = EndpointPool(UPSTREAM_ENDPOINTS)
+        self.hedged_requests = 0
+        self.upstream_scheduler = UpstreamScheduler(TokenBucket(UPSTREAM_RATE_PER_SECOND, UPSTREAM_BURST))
+        # Past expiry, reports stay servable for this long while a refresh runs
+        self.cache_stale_hours = CACHE_MAX_STALE_HOURS if CACHE_STALE_WHILE_REVALIDATE else 0
+        # Expired reports are kept at least this long as a fallback for upstream outages
+        self.cache_retention_hours = max(self.cache_stale_hours, CACHE_FALLBACK_MAX_STALE_HOURS)
+        self._background_tasks: set = set()
+        # Query logging is write-behind: handlers only enqueue
+        self.query_log = WriteBehindLog(self.storage, self._flush_log_events)
+        # Quota checks are answered from memory unless the ledger is disabled
+        self.quota_ledger = QuotaLedger(self.storage) if QUOTA_LEDGER_ENABLED else None
+        self.sketches: Optional[AnalyticsSketches] = None
+        # /admin and its refresh button share one snapshot, rebuilt at most once per TTL
+        self._admin_snapshot: Optional[Dict[str, Any]] = None
+        self._admin_refresh = SingleFlight()
         self.init_database()
+        if ANALYTICS_SKETCHES_ENABLED:
+            self.sketches = self.load_sketches()
         logger.info("✅ Vehicle Intelligence Bot initialized successfully")
 
+    async def close(self) -> None:
+        """Release network and database resources on shutdown"""
+        await self.http.close()
+        if self.quota_ledger:
+            await self.quota_ledger.flush()
+        if self.sketches:
+            await self.persist_sketches()
+        await self.query_log.close()
+        self.storage.close()
+
     def init_database(self):
         """Initialize comprehensive SQLite database schema"""
-        conn = sqlite3.connect(DATABASE_FILE)
+        self.storage.write_sync(self._create_schema)
+        self.storage.write_sync(self._run_migrations)
+        for problem in self.storage.write_sync(self.check_query_plans):
+            logger.warning(f"⚠️ Query plan regression - {problem}")
+        logger.info("📊 Database initialized successfully")
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        """Create all tables on the writer connection"""
         cursor = conn.cursor()
         
         # Users table with detailed tracking
@@ -107,9 +1360,10 @@ class VehicleIntelBot:
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS cache (
                 rc_number TEXT PRIMARY KEY,
-                response_data TEXT,
+                response_data BLOB,
                 cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                hits INTEGER DEFAULT 0
+                hits INTEGER DEFAULT 0,
+                expires_at TIMESTAMP
             )
         ''')
         
@@ -123,272 +1377,617 @@ class VehicleIntelBot:
                 FOREIGN KEY (user_id) REFERENCES users (user_id)
             )
         ''')
-        
-        conn.commit()
-        conn.close()
-        logger.info("📊 Database initialized successfully")
 
-    def log_user_activity(self, user_id: int, username: str, first_name: str, last_name: str) -> None:
-        """Log user activity with daily quota management"""
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        
-        # Check if it's a new day for this user
-        cursor.execute('SELECT last_query_date FROM users WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
-        
-        today = datetime.now().date()
-        reset_daily = False
-        
-        if result:
-            last_date = datetime.strptime(result[0], '%Y-%m-%d').date() if result[0] else None
-            if last_date != today:
-                reset_daily = True
+    def _migrations(self) -> List[Callable[[sqlite3.Connection], None]]:
+        """Ordered schema migrations; list position + 1 is the schema version"""
+        return [
+            self._migrate_compact_cache_format,
+            self._migrate_cache_expiry_column,
+            self._migrate_query_indexes,
+            self._migrate_rollup_tables,
+            self._migrate_sketch_state_table,
+        ]
+
+    def _run_migrations(self, conn: sqlite3.Connection) -> None:
+        """Apply pending migrations, each in its own transaction, tracked via PRAGMA user_version"""
+        current = conn.execute('PRAGMA user_version').fetchone()[0]
+        for version, migration in enumerate(self._migrations(), 1):
+            if version <= current:
+                continue
+            if not conn.in_transaction:
+                conn.execute('BEGIN')
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+            logger.info(f"🧱 Applied schema migration v{version}: {migration.__name__}")
+
+    def _migrate_compact_cache_format(self, conn: sqlite3.Connection) -> None:
+        """v1: rewrite legacy JSON TEXT cache rows into the compact binary format"""
+        rows = conn.execute(
+            "SELECT rc_number, response_data FROM cache WHERE typeof(response_data) = 'text'"
+        ).fetchall()
+        
+        reports = []
+        for rc_number, response_data in rows:
+            try:
+                report = json.loads(response_data)
+                blob = self.encode_cache_entry(report)
+            except (ValueError, KeyError, TypeError):
+                # Unreadable rows stay as TEXT; get_cached_response still handles them
+                continue
+            conn.execute('UPDATE cache SET response_data = ? WHERE rc_number = ?', (blob, rc_number))
+            reports.append(report)
+        
+        if reports:
+            comparison = self.compare_cache_formats(reports)
+            logger.info(
+                f"💾 Migrated {len(reports)} cache rows: "
+                f"{comparison['json_bytes']} -> {comparison['compact_bytes']} bytes "
+                f"({comparison['size_ratio']:.1%}), decode "
+                f"{comparison['json_decode_us']:.1f}us -> {comparison['compact_decode_us']:.1f}us per row"
+            )
+
+    def _migrate_cache_expiry_column(self, conn: sqlite3.Connection) -> None:
+        """v2: add an indexed expires_at column so freshness is checked in SQL"""
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(cache)')}
+        if 'expires_at' not in columns:
+            conn.execute('ALTER TABLE cache ADD COLUMN expires_at TIMESTAMP')
+        conn.execute(
+            f"UPDATE cache SET expires_at = DATETIME(cached_at, '+{CACHE_EXPIRY_HOURS} hours') "
+            f"WHERE expires_at IS NULL"
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_expires_at ON cache (expires_at)')
+
+    def _migrate_query_indexes(self, conn: sqlite3.Connection) -> None:
+        """v3: covering indexes for the per-user history and admin dashboard queries"""
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_queries_user_time ON queries (user_id, timestamp, rc_number, success)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_queries_time_user ON queries (timestamp, user_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_queries_rc ON queries (rc_number)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_queries_success ON queries (success)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_users_queries_count ON users (queries_count, username)')
+        conn.execute('ANALYZE')
+
+    def _migrate_rollup_tables(self, conn: sqlite3.Connection) -> None:
+        """v4: daily rollup tables for the admin dashboard, backfilled from history"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats_daily (
+                day TEXT PRIMARY KEY,
+                queries INTEGER NOT NULL DEFAULT 0,
+                successful INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats_user_daily (
+                day TEXT,
+                user_id INTEGER,
+                queries INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, user_id)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats_rc_daily (
+                day TEXT,
+                rc_number TEXT,
+                queries INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, rc_number)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats_rc_total (
+                rc_number TEXT PRIMARY KEY,
+                queries INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_stats_rc_total_queries ON stats_rc_total (queries)')
+        # The dashboard no longer aggregates raw queries, so these only slowed down logging
+        conn.execute('DROP INDEX IF EXISTS idx_queries_time_user')
+        conn.execute('DROP INDEX IF EXISTS idx_queries_rc')
+        conn.execute('DROP INDEX IF EXISTS idx_queries_success')
+        self._rebuild_rollups(conn)
+
+    def _migrate_sketch_state_table(self, conn: sqlite3.Connection) -> None:
+        """v5: persisted state for the streaming analytics sketches"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sketch_state (
+                name TEXT PRIMARY KEY,
+                state BLOB,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    def _rebuild_rollups(self, conn: sqlite3.Connection) -> int:
+        """Recompute every rollup table from the raw queries history; returns days covered"""
+        for table in ('stats_daily', 'stats_user_daily', 'stats_rc_daily', 'stats_rc_total'):
+            conn.execute(f'DELETE FROM {table}')
         
-        # Update or insert user
-        cursor.execute('''
-            INSERT INTO users 
-            (user_id, username, first_name, last_name, queries_count, queries_today, last_query_date, last_seen)
-            VALUES (?, ?, ?, ?, 1, 1, ?, CURRENT_TIMESTAMP)
-            ON CONFLICT(user_id) DO UPDATE SET
-                username = excluded.username,
-                first_name = excluded.first_name,
-                last_name = excluded.last_name,
-                queries_count = queries_count + 1,
-                queries_today = CASE WHEN ? THEN 1 ELSE queries_today + 1 END,
-                last_query_date = excluded.last_query_date,
-                last_seen = CURRENT_TIMESTAMP
-        ''', (user_id, username, first_name, last_name, today, reset_daily))
-        
-        conn.commit()
-        conn.close()
-
-    def check_user_quota(self, user_id: int) -> tuple[bool, int]:
+        conn.execute('''
+            INSERT INTO stats_daily (day, queries, successful)
+            SELECT DATE(timestamp), COUNT(*), SUM(success = 1) FROM queries GROUP BY DATE(timestamp)
+        ''')
+        conn.execute('''
+            INSERT INTO stats_user_daily (day, user_id, queries)
+            SELECT DATE(timestamp), user_id, COUNT(*) FROM queries GROUP BY DATE(timestamp), user_id
+        ''')
+        conn.execute('''
+            INSERT INTO stats_rc_daily (day, rc_number, queries)
+            SELECT DATE(timestamp), rc_number, COUNT(*) FROM queries GROUP BY DATE(timestamp), rc_number
+        ''')
+        conn.execute('''
+            INSERT INTO stats_rc_total (rc_number, queries)
+            SELECT rc_number, COUNT(*) FROM queries GROUP BY rc_number
+        ''')
+        return conn.execute('SELECT COUNT(*) FROM stats_daily').fetchone()[0]
+
+    def check_query_plans(self, conn: sqlite3.Connection) -> List[str]:
+        """EXPLAIN QUERY PLAN every hot statement and report table scans or missed indexes"""
+        problems = []
+        for name, sql, params, expected_index in QUERY_PLAN_EXPECTATIONS:
+            details = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+            if not any(expected_index in detail for detail in details):
+                problems.append(f"{name}: expected {expected_index}, plan was {details}")
+            elif any(detail.startswith('SCAN') and 'INDEX' not in detail for detail in details):
+                problems.append(f"{name}: full table scan in {details}")
+        return problems
+
+    def encode_cache_entry(self, report: Dict[str, Any]) -> bytes:
+        """Serialize a parsed report into the versioned, compressed cache format.
+
+        Only the metadata and the upstream payload are stored; the presentation
+        sections are rebuilt by parse_intel_data on decode.
+        """
+        meta = report["metadata"]
+        payload = {
+            "t": meta["target"],
+            "ts": meta["timestamp"],
+            "c": meta["data_confidence"],
+            "r": report["raw_data"]
+        }
+        body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        return bytes([CACHE_FORMAT_VERSION]) + zlib.compress(body, CACHE_COMPRESSION_LEVEL)
+
+    def decode_cache_entry(self, stored: Any) -> Dict[str, Any]:
+        """Rebuild a parsed report from a cache row, accepting legacy JSON TEXT rows"""
+        if isinstance(stored, str):
+            return json.loads(stored)
+        
+        version = stored[0]
+        if version != CACHE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported cache format version {version}")
+        
+        payload = json.loads(zlib.decompress(stored[1:]))
+        report = self.parse_intel_data(payload["r"], payload["t"])
+        report["metadata"]["timestamp"] = payload["ts"]
+        report["metadata"]["data_confidence"] = payload["c"]
+        return report
+
+    def compare_cache_formats(self, reports: List[Dict[str, Any]]) -> Dict[str, float]:
+        """Measure stored size and decode time of legacy JSON vs the compact format"""
+        legacy = [json.dumps(report) for report in reports]
+        compact = [self.encode_cache_entry(report) for report in reports]
+        
+        started = time.perf_counter()
+        for stored in legacy:
+            json.loads(stored)
+        json_decode = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        for stored in compact:
+            self.decode_cache_entry(stored)
+        compact_decode = time.perf_counter() - started
+        
+        json_bytes = sum(len(stored.encode('utf-8')) for stored in legacy)
+        compact_bytes = sum(len(stored) for stored in compact)
+        return {
+            "rows": len(reports),
+            "json_bytes": json_bytes,
+            "compact_bytes": compact_bytes,
+            "size_ratio": compact_bytes / json_bytes if json_bytes else 0,
+            "json_decode_us": json_decode / len(reports) * 1e6,
+            "compact_decode_us": compact_decode / len(reports) * 1e6
+        }
+
+    async def check_user_quota(self, user_id: int) -> tuple[bool, int]:
         """Check if user has remaining quota for today"""
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
+        if self.quota_ledger:
+            return await self.quota_ledger.check(user_id)
         
-        cursor.execute('''
-            SELECT queries_today, is_premium, is_banned 
+        result = await self.storage.fetchone('''
+            SELECT CASE WHEN last_query_date = ? THEN queries_today ELSE 0 END, is_premium, is_banned 
             FROM users WHERE user_id = ?
-        ''', (user_id,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if not result:
-            return True, MAX_QUERIES_PER_DAY
-        
-        queries_today, is_premium, is_banned = result
-        
-        if is_banned:
-            return False, 0
-        
-        # Premium users have unlimited queries
-        if is_premium:
-            return True, -1
-        
-        remaining = MAX_QUERIES_PER_DAY - queries_today
-        return remaining > 0, remaining
+        ''', (datetime.now().date().isoformat(), user_id))
+        
+        return quota_state(result)
+
+    async def consume_quota(self, user_id: int, username: str, first_name: str, last_name: str,
+                            units: int = 1) -> tuple[bool, int]:
+        """Atomically reset-by-day, check and consume quota units for a user.
+
+        Returns (granted, remaining) where remaining is -1 for premium users.
+        Nothing is consumed unless all units fit in today's quota, so a batch
+        can reserve its whole size in one call.
+        """
+        if self.quota_ledger:
+            return await self.quota_ledger.consume(user_id, username, first_name, last_name, units)
+        
+        today = datetime.now().date().isoformat()
+        
+        def _consume(conn: sqlite3.Connection) -> tuple[bool, int]:
+            # One upsert does the day reset, the limit check and the increment.
+            # The conflict-path WHERE skips banned or exhausted users, in which
+            # case RETURNING yields no row.
+            row = conn.execute('''
+                INSERT INTO users 
+                (user_id, username, first_name, last_name, queries_count, queries_today, last_query_date, last_seen)
+                SELECT :user_id, :username, :first_name, :last_name, :units, :units, :today, CURRENT_TIMESTAMP
+                WHERE :units <= :limit OR EXISTS (SELECT 1 FROM users WHERE user_id = :user_id)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name,
+                    queries_count = queries_count + :units,
+                    queries_today = CASE WHEN last_query_date = :today
+                        THEN queries_today + :units ELSE :units END,
+                    last_query_date = :today,
+                    last_seen = CURRENT_TIMESTAMP
+                WHERE is_banned = 0 AND (
+                    is_premium = 1
+                    OR CASE WHEN last_query_date = :today THEN queries_today ELSE 0 END + :units <= :limit
+                )
+                RETURNING queries_today, is_premium
+            ''', {
+                "user_id": user_id, "username": username, "first_name": first_name,
+                "last_name": last_name, "units": units, "today": today, "limit": MAX_QUERIES_PER_DAY
+            }).fetchone()
+            
+            if row:
+                queries_today, is_premium = row
+                return True, -1 if is_premium else MAX_QUERIES_PER_DAY - queries_today
+            
+            # Denied: report what is left, read in the same transaction
+            current = conn.execute('''
+                SELECT CASE WHEN last_query_date = ? THEN queries_today ELSE 0 END, is_premium, is_banned
+                FROM users WHERE user_id = ?
+            ''', (today, user_id)).fetchone()
+            return False, max(0, quota_state(current)[1])
+        
+        return await self.storage.write(_consume)
+
+    async def set_user_status(self, user_id: int, is_premium: Optional[bool] = None,
+                              is_banned: Optional[bool] = None) -> bool:
+        """Change a user's premium/ban flags; returns False if the user is unknown"""
+        if self.quota_ledger:
+            # Persist unsaved usage first so a brand-new user's row exists
+            await self.quota_ledger.flush()
+        
+        def _update(conn: sqlite3.Connection) -> int:
+            return conn.execute('''
+                UPDATE users SET
+                    is_premium = COALESCE(?, is_premium),
+                    is_banned = COALESCE(?, is_banned)
+                WHERE user_id = ?
+            ''', (is_premium, is_banned, user_id)).rowcount
+        
+        updated = await self.storage.write(_update)
+        if self.quota_ledger:
+            self.quota_ledger.apply_status(user_id, is_premium, is_banned)
+        return updated > 0
 
     def log_query(self, user_id: int, rc_number: str, success: bool, error_message: str = None) -> None:
         """Log individual query with error tracking"""
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO queries (user_id, rc_number, success, error_message)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, rc_number.upper(), success, error_message))
-        
-        conn.commit()
-        conn.close()
-
-    def cache_response(self, rc_number: str, response_data: Dict[str, Any]) -> None:
+        if self.sketches:
+            self.sketches.observe(user_id, rc_number.upper())
+        self.query_log.add((
+            user_id, rc_number.upper(), success, error_message,
+            datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        ))
+
+    def _flush_log_events(self, conn: sqlite3.Connection, queries: List[tuple]) -> None:
+        """Insert a batch of buffered query rows and fold them into the rollups"""
+        conn.executemany('''
+            INSERT INTO queries (user_id, rc_number, success, error_message, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        ''', queries)
+        self._apply_rollups(conn, queries)
+
+    def _apply_rollups(self, conn: sqlite3.Connection, queries: List[tuple]) -> None:
+        """Fold newly logged queries into the rollup tables in the same transaction"""
+        daily_queries: Counter = Counter()
+        daily_successful: Counter = Counter()
+        user_daily: Counter = Counter()
+        rc_daily: Counter = Counter()
+        rc_total: Counter = Counter()
+        
+        for user_id, rc_number, success, _error, timestamp in queries:
+            day = timestamp[:10]
+            daily_queries[day] += 1
+            daily_successful[day] += 1 if success else 0
+            user_daily[(day, user_id)] += 1
+            rc_daily[(day, rc_number)] += 1
+            rc_total[rc_number] += 1
+        
+        conn.executemany('''
+            INSERT INTO stats_daily (day, queries, successful) VALUES (?, ?, ?)
+            ON CONFLICT(day) DO UPDATE SET
+                queries = queries + excluded.queries,
+                successful = successful + excluded.successful
+        ''', [(day, count, daily_successful[day]) for day, count in daily_queries.items()])
+        conn.executemany('''
+            INSERT INTO stats_user_daily (day, user_id, queries) VALUES (?, ?, ?)
+            ON CONFLICT(day, user_id) DO UPDATE SET queries = queries + excluded.queries
+        ''', [(day, user_id, count) for (day, user_id), count in user_daily.items()])
+        conn.executemany('''
+            INSERT INTO stats_rc_daily (day, rc_number, queries) VALUES (?, ?, ?)
+            ON CONFLICT(day, rc_number) DO UPDATE SET queries = queries + excluded.queries
+        ''', [(day, rc_number, count) for (day, rc_number), count in rc_daily.items()])
+        conn.executemany('''
+            INSERT INTO stats_rc_total (rc_number, queries) VALUES (?, ?)
+            ON CONFLICT(rc_number) DO UPDATE SET queries = queries + excluded.queries
+        ''', list(rc_total.items()))
+
+    def load_sketches(self) -> AnalyticsSketches:
+        """Restore persisted sketch state, starting empty if none is usable"""
+        row = self.storage.write_sync(
+            lambda conn: conn.execute("SELECT state FROM sketch_state WHERE name = 'analytics'").fetchone()
+        )
+        if row:
+            try:
+                return AnalyticsSketches.from_bytes(row[0])
+            except (ValueError, KeyError, zlib.error) as e:
+                logger.warning(f"⚠️ Discarding unreadable sketch state: {str(e)}")
+        return AnalyticsSketches()
+
+    async def persist_sketches(self) -> None:
+        """Save sketch state so approximations survive restarts"""
+        await self.storage.execute('''
+            INSERT OR REPLACE INTO sketch_state (name, state, updated_at)
+            VALUES ('analytics', ?, CURRENT_TIMESTAMP)
+        ''', (self.sketches.to_bytes(),))
+
+    async def backfill_rollups(self) -> int:
+        """Rebuild the rollup tables from the full queries history"""
+        # Pending log events must land first so they are counted exactly once
+        await self.query_log.flush()
+        rebuilt = await self.storage.write(self._rebuild_rollups)
+        # The dashboard snapshot carries history built from the old rollups
+        self._admin_snapshot = None
+        return rebuilt
+
+    async def cache_response(self, rc_number: str, response_data: Dict[str, Any]) -> None:
         """Cache API response for faster subsequent queries"""
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO cache (rc_number, response_data, cached_at, hits)
+        self.render_cache.pop(rc_number.upper())
+        self._remember(rc_number.upper(), response_data, CACHE_EXPIRY_HOURS * 3600)
+        await self.storage.execute(f'''
+            INSERT OR REPLACE INTO cache (rc_number, response_data, cached_at, hits, expires_at)
             VALUES (?, ?, CURRENT_TIMESTAMP, 
-                COALESCE((SELECT hits FROM cache WHERE rc_number = ?), 0) + 1)
-        ''', (rc_number.upper(), json.dumps(response_data), rc_number.upper()))
-        
-        conn.commit()
-        conn.close()
-
-    def get_cached_response(self, rc_number: str) -> Optional[Dict[str, Any]]:
-        """Retrieve cached response if available and not expired"""
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT response_data, cached_at FROM cache 
-            WHERE rc_number = ?
-        ''', (rc_number.upper(),))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if not result:
+                COALESCE((SELECT hits FROM cache WHERE rc_number = ?), 0) + 1,
+                DATETIME('now', '+{CACHE_EXPIRY_HOURS} hours'))
+        ''', (rc_number.upper(), self.encode_cache_entry(response_data), rc_number.upper()))
+
+    def _remember(self, key: str, report: Dict[str, Any], fresh_seconds: float) -> None:
+        """Put a report in the memory tier, keeping it through the retention window"""
+        fresh_until = time.monotonic() + fresh_seconds
+        ttl = fresh_seconds + self.cache_retention_hours * 3600
+        self.memory_cache.set(key, (fresh_until, report), ttl)
+
+    async def get_cached_response(self, rc_number: str, allow_stale: bool = False,
+                                  max_stale_hours: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Retrieve cached response if available and not expired.
+
+        With allow_stale, reports up to max_stale_hours (cache_stale_hours by
+        default) past expiry are also returned, with metadata["stale"] set.
+        """
+        key = rc_number.upper()
+        entry = self.memory_cache.get(key)
+        if entry is not None:
+            fresh_until, report = entry
+            fresh_seconds = fresh_until - time.monotonic()
+        else:
+            # Freshness is checked in SQL against the indexed expiry column
+            result = await self.storage.fetchone(f'''
+                SELECT response_data, (JULIANDAY(expires_at) - JULIANDAY('now')) * 86400
+                FROM cache 
+                WHERE rc_number = ? AND expires_at > DATETIME('now', '-{self.cache_retention_hours} hours')
+            ''', (key,))
+            
+            if not result:
+                return None
+            
+            cached_data, fresh_seconds = result
+            report = self.decode_cache_entry(cached_data)
+            self._remember(key, report, fresh_seconds)
+        
+        if fresh_seconds > 0:
+            # Shallow copy so callers can flag the result without touching the shared entry
+            return dict(report)
+        if not allow_stale:
             return None
-        
-        cached_data, cached_at = result
-        cached_time = datetime.strptime(cached_at, '%Y-%m-%d %H:%M:%S')
-        
-        # Check if cache is still valid
-        if datetime.now() - cached_time > timedelta(hours=CACHE_EXPIRY_HOURS):
+        if max_stale_hours is None:
+            max_stale_hours = self.cache_stale_hours
+        if -fresh_seconds > max_stale_hours * 3600:
             return None
         
-        return json.loads(cached_data)
+        stale_report = dict(report)
+        stale_report["metadata"] = {**report["metadata"], "stale": True}
+        return stale_report
+
+    async def sweep_expired_cache(self) -> int:
+        """Delete expired cache rows in small batches so the writer is never held for long"""
+        def _delete_batch(conn: sqlite3.Connection) -> int:
+            cursor = conn.execute('''
+                DELETE FROM cache WHERE rowid IN (
+                    SELECT rowid FROM cache WHERE expires_at <= DATETIME('now', ?) LIMIT ?
+                )
+            ''', (f'-{self.cache_retention_hours} hours', CACHE_SWEEP_BATCH_SIZE))
+            return cursor.rowcount
+        
+        total_deleted = 0
+        while True:
+            deleted = await self.storage.write(_delete_batch)
+            total_deleted += deleted
+            if deleted < CACHE_SWEEP_BATCH_SIZE:
+                return total_deleted
 
     def validate_rc_number(self, rc_number: str) -> bool:
         """Validate RC number format"""
         rc_clean = rc_number.strip().upper().replace(" ", "").replace("-", "")
         return bool(RC_PATTERN.match(rc_clean))
 
-    def get_user_stats(self, user_id: int) -> Dict[str, Any]:
+    async def get_user_stats(self, user_id: int) -> Dict[str, Any]:
         """Get detailed statistics for a user"""
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT queries_count, queries_today, first_seen, last_seen, is_premium
-            FROM users WHERE user_id = ?
-        ''', (user_id,))
-        
-        result = cursor.fetchone()
-        
-        if not result:
-            conn.close()
-            return None
-        
-        queries_count, queries_today, first_seen, last_seen, is_premium = result
-        
-        # Get recent queries
-        cursor.execute('''
-            SELECT rc_number, timestamp, success 
-            FROM queries 
-            WHERE user_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 5
-        ''', (user_id,))
-        
-        recent_queries = cursor.fetchall()
-        conn.close()
+        # Usage not yet flushed from the quota ledger is more current than the row
+        entry = self.quota_ledger.peek(user_id) if self.quota_ledger else None
         
+        def _collect(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT queries_count, queries_today, first_seen, last_seen, is_premium
+                FROM users WHERE user_id = ?
+            ''', (user_id,))
+            
+            result = cursor.fetchone()
+            
+            if not result:
+                if not entry or not entry["pending"]:
+                    return None
+                # First queries are still only in the ledger; the row lands on the next flush
+                result = (0, 0, entry["last_seen"], entry["last_seen"], entry["is_premium"])
+            
+            queries_count, queries_today, first_seen, last_seen, is_premium = result
+            
+            # Get recent queries
+            cursor.execute(SQL_USER_RECENT_QUERIES, (user_id,))
+            
+            recent_queries = cursor.fetchall()
+            
+            return {
+                "total_queries": queries_count,
+                "queries_today": queries_today,
+                "remaining_today": -1 if is_premium else max(0, MAX_QUERIES_PER_DAY - queries_today),
+                "first_seen": first_seen,
+                "last_seen": last_seen,
+                "is_premium": is_premium,
+                "recent_queries": recent_queries
+            }
+        
+        stats = await self.storage.read(_collect)
+        
+        if stats and entry:
+            stats["total_queries"] += entry["pending"]
+            stats["queries_today"] = entry["used"]
+            stats["remaining_today"] = -1 if entry["is_premium"] else max(0, MAX_QUERIES_PER_DAY - entry["used"])
+            stats["last_seen"] = entry["last_seen"] or stats["last_seen"]
+        return stats
+
+    def _in_memory_admin_stats(self) -> Dict[str, Any]:
+        """Dashboard figures kept in process memory rather than SQLite"""
         return {
-            "total_queries": queries_count,
-            "queries_today": queries_today,
-            "remaining_today": -1 if is_premium else max(0, MAX_QUERIES_PER_DAY - queries_today),
-            "first_seen": first_seen,
-            "last_seen": last_seen,
-            "is_premium": is_premium,
-            "recent_queries": recent_queries
+            "memory_cache": self.memory_cache.stats(),
+            "upstream": {"endpoints": self.upstreams.stats(), "hedged": self.hedged_requests},
+            "upstream_waits": self.upstream_scheduler.stats(),
+            "live": self.sketches.snapshot() if self.sketches else None
         }
 
-    def get_admin_stats(self) -> Dict[str, Any]:
-        """Get comprehensive admin statistics"""
-        conn = sqlite3.connect(DATABASE_FILE)
+    async def get_admin_dashboard(self) -> tuple:
+        """Return the shared dashboard snapshot as (stats, feedback, age in seconds)"""
+        snapshot = self._admin_snapshot
+        if snapshot is None or time.monotonic() - snapshot["taken_at"] >= ADMIN_STATS_TTL_SECONDS:
+            snapshot = await self._admin_refresh.do("dashboard", self._refresh_admin_dashboard)
+        return snapshot["stats"], snapshot["feedback"], time.monotonic() - snapshot["taken_at"]
+
+    async def _refresh_admin_dashboard(self) -> Dict[str, Any]:
+        """Rebuild the dashboard snapshot from deltas since the previous one"""
+        previous = self._admin_snapshot
+        stats = await self.storage.read(self._collect_admin_stats, previous["stats"] if previous else None)
+        stats.update(self._in_memory_admin_stats())
+        
+        last_feedback_id = previous["feedback"][0][0] if previous and previous["feedback"] else 0
+        feedback = await self.get_feedback_list(after_id=last_feedback_id)
+        if previous:
+            feedback = (feedback + previous["feedback"])[:10]
+        
+        self._admin_snapshot = {"stats": stats, "feedback": feedback, "taken_at": time.monotonic()}
+        return self._admin_snapshot
+
+    def _collect_admin_stats(self, conn: sqlite3.Connection,
+                             previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run the admin dashboard aggregates on a reader connection.
+
+        Totals for closed days are carried over from ``previous`` while it is
+        still the same UTC day, so only today's rollup row is re-read.
+        """
         cursor = conn.cursor()
+        day = cursor.execute("SELECT DATE('now')").fetchone()[0]
         
         # Total users
         cursor.execute('SELECT COUNT(*) FROM users')
         total_users = cursor.fetchone()[0]
         
-        # Total queries
-        cursor.execute('SELECT COUNT(*) FROM queries')
-        total_queries = cursor.fetchone()[0]
-        
-        # Successful queries
-        cursor.execute('SELECT COUNT(*) FROM queries WHERE success = 1')
-        successful_queries = cursor.fetchone()[0]
+        # Queries before today
+        if previous and previous["day"] == day:
+            history = previous["history"]
+        else:
+            cursor.execute(SQL_QUERY_HISTORY_TOTALS, (day,))
+            history = tuple(cursor.fetchone())
         
         # Queries today
-        cursor.execute('''
-            SELECT COUNT(*) FROM queries 
-            WHERE DATE(timestamp) = DATE('now')
-        ''')
-        queries_today = cursor.fetchone()[0]
+        cursor.execute(SQL_QUERIES_TODAY, (day,))
+        queries_today, successful_today = cursor.fetchone()
+        total_queries = history[0] + queries_today
+        successful_queries = history[1] + successful_today
         
         # Active users today
-        cursor.execute('''
-            SELECT COUNT(DISTINCT user_id) FROM queries 
-            WHERE DATE(timestamp) = DATE('now')
-        ''')
+        cursor.execute(SQL_ACTIVE_USERS_TODAY, (day,))
         active_today = cursor.fetchone()[0]
         
+        # Most queried RCs today
+        cursor.execute(SQL_TOP_RCS_TODAY, (day,))
+        top_rcs_today = cursor.fetchall()
+        
         # Top 5 users
-        cursor.execute('''
-            SELECT user_id, username, queries_count 
-            FROM users 
-            ORDER BY queries_count DESC 
-            LIMIT 5
-        ''')
+        cursor.execute(SQL_TOP_USERS)
         top_users = cursor.fetchall()
         
         # Most queried RCs
-        cursor.execute('''
-            SELECT rc_number, COUNT(*) as count 
-            FROM queries 
-            GROUP BY rc_number 
-            ORDER BY count DESC 
-            LIMIT 5
-        ''')
+        cursor.execute(SQL_TOP_RCS)
         top_rcs = cursor.fetchall()
         
         # Cache stats
         cursor.execute('SELECT COUNT(*) FROM cache')
         cache_size = cursor.fetchone()[0]
         
-        conn.close()
-        
         return {
+            "day": day,
+            "history": history,
             "total_users": total_users,
             "total_queries": total_queries,
             "successful_queries": successful_queries,
             "queries_today": queries_today,
             "active_today": active_today,
+            "top_rcs_today": top_rcs_today,
             "success_rate": (successful_queries / total_queries * 100) if total_queries > 0 else 0,
             "top_users": top_users,
             "top_rcs": top_rcs,
             "cache_size": cache_size
         }
 
-    def save_feedback(self, user_id: int, message: str) -> None:
+    async def save_feedback(self, user_id: int, message: str) -> None:
         """Save user feedback"""
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        await self.storage.execute('''
             INSERT INTO feedback (user_id, message)
             VALUES (?, ?)
         ''', (user_id, message))
-        
-        conn.commit()
-        conn.close()
 
-    def get_feedback_list(self) -> List[tuple]:
-        """Get recent feedback for admins"""
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT f.id, f.user_id, u.username, f.message, f.timestamp
-            FROM feedback f
-            LEFT JOIN users u ON f.user_id = u.user_id
-            ORDER BY f.timestamp DESC
-            LIMIT 10
-        ''')
-        
-        feedback = cursor.fetchall()
-        conn.close()
-        
-        return feedback
+    async def get_feedback_list(self, after_id: int = 0) -> List[tuple]:
+        """Get recent feedback for admins, newest first"""
+        return await self.storage.fetchall(SQL_FEEDBACK_SINCE, (after_id,))
+
+    async def query_rc_api(self, rc_number: str, use_cache: bool = True, priority: int = UPSTREAM_PRIORITY_FREE,
+                           deadline: float = LOOKUP_DEADLINE_SECONDS) -> Dict[str, Any]:
+        """Enhanced API query with caching, retry logic and comprehensive error handling.
 
-    async def query_rc_api(self, rc_number: str, use_cache: bool = True) -> Dict[str, Any]:
-        """Enhanced API query with caching, retry logic and comprehensive error handling"""
+        `deadline` bounds the whole upstream fetch in seconds, retries included.
+        """
         rc_clean = rc_number.strip().upper().replace(" ", "").replace("-", "")
         
         # Validate RC format
@@ -397,24 +1996,94 @@ class VehicleIntelBot:
         
         # Check cache first
         if use_cache:
-            cached = self.get_cached_response(rc_clean)
+            cached = await self.get_cached_response(rc_clean, allow_stale=CACHE_STALE_WHILE_REVALIDATE)
             if cached:
-                logger.info(f"✅ Cache hit for {rc_clean}")
+                if cached['metadata'].get('stale'):
+                    logger.info(f"♻️ Serving stale cache for {rc_clean}, refreshing in background")
+                    self._refresh_in_background(rc_clean)
+                else:
+                    logger.info(f"✅ Cache hit for {rc_clean}")
                 cached['from_cache'] = True
                 return cached
         
-        # Query API with retry logic
+        # Identical lookups already in flight share one upstream call (at the leader's priority)
+        result = await self.inflight.do(rc_clean, lambda: self._fetch_from_api(rc_clean, priority, deadline))
+        return dict(result)
+
+    def _refresh_in_background(self, rc_clean: str) -> None:
+        """Revalidate a stale cache entry without blocking the caller"""
+        task = asyncio.create_task(
+            self.inflight.do(rc_clean, lambda: self._fetch_from_api(rc_clean, UPSTREAM_PRIORITY_BATCH))
+        )
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_done)
+
+    def _on_background_done(self, task: asyncio.Task) -> None:
+        """Forget a finished background task and log its failure, if any"""
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"❌ Background refresh failed: {task.exception()}")
+
+    async def _fetch_from_api(self, rc_clean: str, priority: int = UPSTREAM_PRIORITY_FREE,
+                              deadline: float = LOOKUP_DEADLINE_SECONDS) -> Dict[str, Any]:
+        """Query the healthiest upstream endpoint and cache successful reports.
+
+        All attempts, waits and backoff share one `deadline` (seconds); each
+        attempt gets half of what is left, the last one all of it. Retries go
+        to a different endpoint when another one is available.
+        """
         max_retries = 3
+        deadline_at = time.monotonic() + deadline
+        timeout_error = {"error": "⏱️ Request timeout - API is unresponsive"}
+        result = timeout_error
+        endpoint = None
         for attempt in range(max_retries):
+            if deadline_at - time.monotonic() <= 0:
+                break
+            
+            endpoint, wait = self.upstreams.acquire(avoid=endpoint)
+            if endpoint is None:
+                return await self._serve_cached_or(rc_clean, {
+                    "error": f"⚠️ Vehicle database is temporarily unavailable. Please try again in {math.ceil(wait)}s"
+                })
+            breaker = endpoint.breaker
+            
+            # Process-wide cap on the upstream call rate, shared by every user in priority order
+            token_wait = min(UPSTREAM_TOKEN_WAIT_SECONDS, deadline_at - time.monotonic())
+            if not await self.upstream_scheduler.acquire(priority, token_wait):
+                breaker.cancel()
+                logger.warning(f"⏳ Upstream rate limit saturated, {rc_clean} not fetched")
+                return await self._serve_cached_or(rc_clean, {
+                    "error": "⏳ Too many lookups right now. Please try again in a few seconds"
+                })
+            
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                breaker.cancel()
+                break
+            budget = remaining if attempt == max_retries - 1 else remaining / 2
+            logger.info(f"🔍 Querying API: {endpoint.url_for(rc_clean)} "
+                        f"(Attempt {attempt + 1}/{max_retries}, {budget:.1f}s budget)")
+            started = time.monotonic()
             try:
-                url = f"{API_BASE}{rc_clean}"
-                logger.info(f"🔍 Querying API: {url} (Attempt {attempt + 1}/{max_retries})")
-                
-                response = self.session.get(url, timeout=20)
+                endpoint, (status, data, retry_after) = await self._get_with_hedge(endpoint, rc_clean, budget)
+                breaker = endpoint.breaker
+            except asyncio.TimeoutError:
+                breaker.record(False, time.monotonic() - started)
+                logger.warning(f"⏱️ Timeout on attempt {attempt + 1}")
+                result = timeout_error
+            except aiohttp.ClientConnectionError:
+                breaker.record(False, time.monotonic() - started)
+                result = {"error": "🌐 Connection error - Please check your internet"}
+            except Exception as e:
+                breaker.record(False, time.monotonic() - started)
+                logger.error(f"❌ Unexpected error: {str(e)}")
+                return {"error": f"System error: {str(e)}"}
+            else:
+                # 4xx other than 429 is about the request, not upstream health
+                breaker.record(status < 500 and status != 429, time.monotonic() - started)
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    
+                if status == 200:
                     # Check if API returned error
                     if isinstance(data, dict) and data.get('error'):
                         return {"error": data.get('error')}
@@ -422,38 +2091,83 @@ class VehicleIntelBot:
                     # Parse and cache the response
                     parsed_data = self.parse_intel_data(data, rc_clean)
                     if 'error' not in parsed_data:
-                        self.cache_response(rc_clean, parsed_data)
+                        await self.cache_response(rc_clean, parsed_data)
                     
                     return parsed_data
-                    
-                elif response.status_code == 404:
-                    return {"error": "❌ Vehicle not found in database"}
-                elif response.status_code == 429:
-                    return {"error": "⚠️ Rate limit exceeded. Please try again later"}
-                else:
-                    if attempt < max_retries - 1:
-                        time.sleep(2 ** attempt)  # Exponential backoff
-                        continue
-                    return {"error": f"API Error: HTTP {response.status_code}"}
-                    
-            except requests.exceptions.Timeout:
-                if attempt < max_retries - 1:
-                    logger.warning(f"⏱️ Timeout on attempt {attempt + 1}, retrying...")
-                    time.sleep(2 ** attempt)
-                    continue
-                return {"error": "⏱️ Request timeout - API is unresponsive"}
                 
-            except requests.exceptions.ConnectionError:
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
+                elif status == 404:
+                    return {"error": "❌ Vehicle not found in database"}
+                elif status == 429 or retry_after is not None:
+                    # Every caller waits out this endpoint's Retry-After, not just this one
+                    breaker.hold_off(retry_after if retry_after is not None else breaker.open_seconds)
                     continue
-                return {"error": "🌐 Connection error - Please check your internet"}
-                
-            except Exception as e:
-                logger.error(f"❌ Unexpected error: {str(e)}")
-                return {"error": f"System error: {str(e)}"}
-        
-        return {"error": "Failed to fetch data after multiple attempts"}
+                result = {"error": f"API Error: HTTP {status}"}
+            
+            if attempt < max_retries - 1:
+                # Backoff never eats more than a quarter of what is left for the retries
+                await asyncio.sleep(max(0.0, min(backoff_delay(attempt), (deadline_at - time.monotonic()) / 4)))
+        
+        return result
+
+    async def _get_with_hedge(self, endpoint: "UpstreamEndpoint", rc_clean: str, timeout: float) -> tuple:
+        """GET the report within `timeout`; past the endpoint's p95, race a hedged request.
+
+        The hedge goes to another admitted endpoint when there is one, and only
+        if an upstream token is free right away. Returns (endpoint that
+        answered, get_json result); the losing request is cancelled and its
+        endpoint's admission handed back. On failure the caller records
+        against the primary endpoint.
+        """
+        started = time.monotonic()
+        hedge_after = endpoint.breaker.p95() if HEDGE_REQUESTS else None
+        primary = asyncio.ensure_future(self.http.get_json(endpoint.url_for(rc_clean)))
+        tasks = {primary: endpoint}
+        answered = endpoint
+        try:
+            if hedge_after is None or hedge_after >= timeout:
+                return endpoint, await asyncio.wait_for(primary, timeout)
+            
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                hedge_endpoint, _ = self.upstreams.acquire(avoid=endpoint)
+                if hedge_endpoint is not None and self.upstream_scheduler.try_acquire_now():
+                    logger.info(f"🏁 Hedging slow call to {endpoint.name} after {hedge_after:.2f}s "
+                                f"via {hedge_endpoint.name}")
+                    self.hedged_requests += 1
+                    tasks[asyncio.ensure_future(self.http.get_json(hedge_endpoint.url_for(rc_clean)))] = hedge_endpoint
+                elif hedge_endpoint is not None:
+                    hedge_endpoint.breaker.cancel()
+            
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=started + timeout - time.monotonic(), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        answered = tasks[task]
+                        return answered, task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task, task_endpoint in tasks.items():
+                if not task.done():
+                    task.cancel()
+                if task_endpoint is not answered:
+                    task_endpoint.breaker.cancel()
+
+    async def _serve_cached_or(self, rc_clean: str, error: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer without touching the upstream: a stale cached report if any, else the error"""
+        cached = await self.get_cached_response(rc_clean, allow_stale=True,
+                                                max_stale_hours=CACHE_FALLBACK_MAX_STALE_HOURS)
+        if cached:
+            logger.info(f"🔌 Upstream unavailable, serving cached report for {rc_clean}")
+            cached['from_cache'] = True
+            return cached
+        return error
 
     def parse_intel_data(self, data: Any, rc_number: str) -> Dict[str, Any]:
         """Parse and structure comprehensive intelligence data from API"""
@@ -563,109 +2277,86 @@ class VehicleIntelBot:
         meta = report["metadata"]
         from_cache = " (Cached)" if meta.get("from_cache") else ""
         
-        message = "╔══════════════════════════════╗\n"
-        message += "║  🚗 *RC INFORMATION REPORT*  ║\n"
-        message += "╚══════════════════════════════╝\n\n"
+        parts = [REPORT_HEADER, f"🎯 *Target:* `{meta['target']}`{from_cache}\n🕐 *Generated:* {meta['timestamp']}\n"]
+        if meta.get("stale"):
+            parts.append(REPORT_STALE_LINE)
+        parts.append(f"📊 *Confidence:* {meta['data_confidence']}\n")
+        parts.append(REPORT_OWNERSHIP_HEADING)
+        append_report_fields(parts, report["ownership"])
         
-        # Metadata
-        message += f"🎯 *Target:* `{meta['target']}`{from_cache}\n"
-        message += f"🕐 *Generated:* {meta['timestamp']}\n"
-        message += f"📊 *Confidence:* {meta['data_confidence']}\n"
-        message += "═" * 35 + "\n\n"
+        if report["rto"].get("🏢 Registered RTO", "N/A") != "N/A":
+            parts.append(REPORT_RTO_HEADING)
+            append_report_fields(parts, report["rto"])
         
-        # 🚗 Ownership Details
-        message += "🚗 *OWNERSHIP DETAILS*\n"
-        message += "─" * 35 + "\n"
-        for key, value in report["ownership"].items():
-            if value and value != "N/A":
-                message += f"{key}: `{value}`\n"
+        parts.append(REPORT_VEHICLE_HEADING)
+        append_report_fields(parts, report["vehicle"])
+        
+        parts.append(REPORT_INSURANCE_HEADING)
+        if not append_report_fields(parts, report["insurance"]):
+            parts.append("⚠️ _No insurance information available_\n")
+        
+        insurance_expiry = str(report["insurance"].get("🚫 Insurance Expiry In", "N/A")).lower()
+        if "expired" in insurance_expiry or "overdue" in insurance_expiry:
+            parts.append(REPORT_INSURANCE_WARNING)
+        
+        parts.append(REPORT_DATES_HEADING)
+        append_report_fields(parts, report["dates"])
+        
+        parts.append(REPORT_OTHER_HEADING)
+        if not append_report_fields(parts, report["other"]):
+            parts.append("_No additional information_\n")
         
-        # 🏢 RTO Information
-        if report["rto"].get("🏢 Registered RTO", "N/A") != "N/A":
-            message += "\n🏢 *RTO INFORMATION*\n"
-            message += "─" * 35 + "\n"
-            for key, value in report["rto"].items():
-                if value and value != "N/A":
-                    message += f"{key}: `{value}`\n"
-        
-        # 🧰 Vehicle Details
-        message += "\n🧰 *VEHICLE DETAILS*\n"
-        message += "─" * 35 + "\n"
-        for key, value in report["vehicle"].items():
-            if value and value != "N/A":
-                message += f"{key}: `{value}`\n"
-        
-        # 📄 Insurance Information
-        message += "\n📄 *INSURANCE INFORMATION*\n"
-        message += "─" * 35 + "\n"
-        has_insurance_data = False
-        for key, value in report["insurance"].items():
-            if value and value != "N/A":
-                has_insurance_data = True
-                message += f"{key}: `{value}`\n"
-        
-        if not has_insurance_data:
-            message += "⚠️ _No insurance information available_\n"
-        
-        # Check for expired insurance warning
-        insurance_expiry = report["insurance"].get("🚫 Insurance Expiry In", "N/A")
-        if "expired" in str(insurance_expiry).lower() or "overdue" in str(insurance_expiry).lower():
-            message += "\n⚠️ *WARNING:* Insurance has expired! Renew immediately.\n"
-        
-        # 🗓 Important Dates & Validity
-        message += "\n🗓 *IMPORTANT DATES & VALIDITY*\n"
-        message += "─" * 35 + "\n"
-        for key, value in report["dates"].items():
-            if value and value != "N/A":
-                message += f"{key}: `{value}`\n"
-        
-        # 🛍 Other Information
-        message += "\n🛍 *OTHER INFORMATION*\n"
-        message += "─" * 35 + "\n"
-        has_other_data = False
-        for key, value in report["other"].items():
-            if value and value != "N/A":
-                has_other_data = True
-                message += f"{key}: `{value}`\n"
-        
-        if not has_other_data:
-            message += "_No additional information_\n"
-        
-        # 📁 NOC Details
         noc_details = report["noc"].get("NOC Details", "N/A")
         if noc_details and noc_details != "N/A":
-            message += "\n📁 *NOC DETAILS*\n"
-            message += "─" * 35 + "\n"
-            message += f"NOC Details: `{noc_details}`\n"
-        
-        # 🪪 Basic Card Info (if different from main data)
-        message += "\n🪪 *BASIC CARD INFO*\n"
-        message += "─" * 35 + "\n"
-        has_card_data = False
-        for key, value in report["card_info"].items():
-            if value and value != "N/A" and key not in ["😀 Owner Name"]:
-                has_card_data = True
-                message += f"{key}: `{value}`\n"
-        
-        if not has_card_data:
-            message += "_No additional card information_\n"
-        
-        # 🚨 Security Alerts (Blacklist status)
+            parts.append(f"{REPORT_NOC_HEADING}NOC Details: `{noc_details}`\n")
+        
+        parts.append(REPORT_CARD_HEADING)
+        if not append_report_fields(parts, report["card_info"], skip="😀 Owner Name"):
+            parts.append("_No additional card information_\n")
+        
         blacklist = report["other"].get("🚫 Blacklist Status", "N/A")
         if blacklist and blacklist != "N/A" and blacklist.lower() != "no":
-            message += "\n🚨 *SECURITY ALERT*\n"
-            message += "─" * 35 + "\n"
-            message += f"⚠️ *Blacklist Status:* `{blacklist}`\n"
+            parts.append(f"{REPORT_SECURITY_HEADING}⚠️ *Blacklist Status:* `{blacklist}`\n")
         
-        message += "\n" + "═" * 35 + "\n"
-        message += "🚀 *Made by RC Info Bot*\n"
-        message += "📱 _Powered by VVVin API_\n"
+        parts.append(REPORT_FOOTER)
+        return "".join(parts)
+
+    def render_report(self, report: Dict[str, Any]) -> tuple:
+        """Return the report as ready-to-send message chunks, memoized per report version"""
+        if "error" in report:
+            return split_message(self.format_intel_message(report))
         
-        return message
+        meta = report["metadata"]
+        version = (RENDERER_VERSION, meta["timestamp"])
+        variant = (bool(meta.get("from_cache")), bool(meta.get("stale")))
+        
+        entry = self.render_cache.get(meta["target"])
+        if entry is None or entry[0] != version:
+            entry = (version, {})
+            self.render_cache.set(meta["target"], entry)
+        
+        chunks = entry[1].get(variant)
+        if chunks is None:
+            chunks = split_message(self.format_intel_message(report))
+            entry[1][variant] = chunks
+        return chunks
 
 # ===== TELEGRAM BOT HANDLERS =====
 bot_instance = VehicleIntelBot()
 
+async def reply_chunks(message, chunks, reply_markup=None, priority: int = SEND_PRIORITY_INTERACTIVE) -> None:
+    """Reply with each chunk in order, attaching the keyboard to the last one"""
+    # Only the bot's own methods take rate_limit_args, Message shortcuts do not
+    bot = message.get_bot()
+    for i, chunk in enumerate(chunks):
+        await bot.send_message(
+            message.chat_id,
+            chunk,
+            parse_mode='Markdown',
+            reply_markup=reply_markup if i == len(chunks) - 1 else None,
+            rate_limit_args=priority
+        )
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handler for /start command with enhanced welcome message"""
     user = update.effective_user
@@ -750,6 +2441,8 @@ Send /feedback to share:
 
 👑 *ADMIN COMMANDS* (Admins only)
 /admin - Admin dashboard
+/setstatus - Set a user's premium or ban status
+/backfill\\_stats - Rebuild dashboard rollups from history
 /broadcast - Send message to all users
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -772,7 +2465,7 @@ async def lookup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = user.id
     
     # Check user quota
-    has_quota, remaining = bot_instance.check_user_quota(user_id)
+    has_quota, remaining = await bot_instance.check_user_quota(user_id)
     
     if not has_quota:
         await update.message.reply_text(
@@ -804,18 +2497,6 @@ async def handle_rc_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_id = user.id
     
-    # Log user activity
-    bot_instance.log_user_activity(user_id, user.username, user.first_name, user.last_name)
-    
-    # Check quota again
-    has_quota, remaining = bot_instance.check_user_quota(user_id)
-    if not has_quota:
-        await update.message.reply_text(
-            "⚠️ Daily limit reached! Please try again tomorrow or upgrade to Premium.",
-            parse_mode='Markdown'
-        )
-        return ConversationHandler.END
-    
     # Validate RC number format
     if not bot_instance.validate_rc_number(rc_number):
         await update.message.reply_text(
@@ -830,38 +2511,48 @@ async def handle_rc_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return WAITING_RC
     
+    # Check and consume one query from today's quota in a single step
+    has_quota, remaining = await bot_instance.consume_quota(
+        user_id, user.username, user.first_name, user.last_name
+    )
+    if not has_quota:
+        await update.message.reply_text(
+            "⚠️ Daily limit reached! Please try again tomorrow or upgrade to Premium.",
+            parse_mode='Markdown'
+        )
+        return ConversationHandler.END
+    
     # Send processing message
     processing_msg = await update.message.reply_text(
         f"🔍 *PROCESSING REQUEST*\n\n"
         f"📍 Target: `{rc_number}`\n"
         f"⏳ Fetching data from database...\n"
-        f"⚡ This may take 10-20 seconds",
+        f"⚡ This may take up to {LOOKUP_DEADLINE_SECONDS:.0f} seconds",
         parse_mode='Markdown'
     )
     
     try:
         # Query API
-        intel_report = await bot_instance.query_rc_api(rc_number)
+        # Premium users (unlimited quota) go ahead of free and batch lookups upstream
+        priority = UPSTREAM_PRIORITY_PREMIUM if remaining < 0 else UPSTREAM_PRIORITY_FREE
+        intel_report = await bot_instance.query_rc_api(rc_number, priority=priority)
         
         # Log the query
         success = "error" not in intel_report
         error_msg = intel_report.get('error') if not success else None
         bot_instance.log_query(user_id, rc_number, success, error_msg)
         
-        # Format and send response
-        response_text = bot_instance.format_intel_message(intel_report)
+        # Format and send response, already split to fit Telegram's 4096 character limit
+        parts = bot_instance.render_report(intel_report)
         
-        # Split message if too long (Telegram limit is 4096 characters)
-        if len(response_text) > 4000:
+        if len(parts) > 1:
             # Send in parts
-            parts = [response_text[i:i+4000] for i in range(0, len(response_text), 4000)]
             await processing_msg.delete()
-            for i, part in enumerate(parts):
-                await update.message.reply_text(part, parse_mode='Markdown')
+            await reply_chunks(update.message, parts)
         else:
             # Edit original message with results
             await processing_msg.edit_text(
-                response_text,
+                parts[0],
                 parse_mode='Markdown'
             )
         
@@ -892,7 +2583,7 @@ async def batch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = user.id
     
     # Check quota
-    has_quota, remaining = bot_instance.check_user_quota(user_id)
+    has_quota, remaining = await bot_instance.check_user_quota(user_id)
     
     if not has_quota:
         await update.message.reply_text(
@@ -942,7 +2633,7 @@ async def handle_batch_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return BATCH_MODE
     
     # Check quota
-    has_quota, remaining = bot_instance.check_user_quota(user_id)
+    has_quota, remaining = await bot_instance.check_user_quota(user_id)
     max_batch = min(10, remaining if remaining >= 0 else 10)
     
     if len(rc_numbers) > max_batch:
@@ -953,6 +2644,20 @@ async def handle_batch_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return BATCH_MODE
     
+    # Reserve quota for every well-formed RC up front
+    valid_count = sum(1 for rc in rc_numbers if bot_instance.validate_rc_number(rc))
+    if valid_count:
+        has_quota, remaining = await bot_instance.consume_quota(
+            user_id, user.username, user.first_name, user.last_name, units=valid_count
+        )
+        if not has_quota:
+            await update.message.reply_text(
+                f"⚠️ Not enough quota left for {valid_count} vehicle(s).\n"
+                f"Remaining quota: {remaining}",
+                parse_mode='Markdown'
+            )
+            return BATCH_MODE
+    
     # Process batch
     processing_msg = await update.message.reply_text(
         f"📊 *BATCH PROCESSING*\n\n"
@@ -961,39 +2666,60 @@ async def handle_batch_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         parse_mode='Markdown'
     )
     
-    results = []
-    for i, rc in enumerate(rc_numbers, 1):
-        # Update progress
-        if i % 2 == 0:
-            await processing_msg.edit_text(
-                f"📊 *BATCH PROCESSING*\n\n"
-                f"Progress: {i}/{len(rc_numbers)}\n"
-                f"⏳ Processing...",
-                parse_mode='Markdown'
-            )
-        
+    results: List[Optional[str]] = [None] * len(rc_numbers)
+    reports: List[Optional[Dict[str, Any]]] = [None] * len(rc_numbers)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def process_rc(index: int, rc: str) -> None:
+        """Look up one batch item and store its summary line and report at its input position"""
         # Validate format
         if not bot_instance.validate_rc_number(rc):
-            results.append(f"❌ {rc}: Invalid format")
-            continue
+            results[index] = f"❌ {rc}: Invalid format"
+            return
         
-        # Query API
-        intel_report = await bot_instance.query_rc_api(rc)
-        success = "error" not in intel_report
-        bot_instance.log_query(user_id, rc, success, intel_report.get('error'))
-        bot_instance.log_user_activity(user_id, user.username, user.first_name, user.last_name)
+        try:
+            # Upstream calls are paced by the shared limiter; cache hits skip it
+            async with semaphore:
+                intel_report = await bot_instance.query_rc_api(rc, priority=UPSTREAM_PRIORITY_BATCH)
+            
+            success = "error" not in intel_report
+            bot_instance.log_query(user_id, rc, success, intel_report.get('error'))
+        except Exception as e:
+            logger.error(f"Error processing batch RC {rc}: {str(e)}")
+            results[index] = f"❌ {rc}: System error"
+            return
         
         if success:
             owner = intel_report['ownership'].get('😀 Owner Name', 'N/A')
             model = intel_report['vehicle'].get('🚘 Model Name', 'N/A')
-            results.append(f"✅ {rc}: {owner} - {model}")
+            results[index] = f"✅ {rc}: {owner} - {model}"
+            reports[index] = intel_report
         else:
             error = intel_report.get('error', 'Unknown error')
-            results.append(f"❌ {rc}: {error}")
-        
-        # Small delay to avoid rate limiting
-        if i < len(rc_numbers):
-            await asyncio.sleep(2)
+            results[index] = f"❌ {rc}: {error}"
+    
+    # Fan out under the concurrency limit and stream results as they complete
+    tasks = [asyncio.create_task(process_rc(i, rc)) for i, rc in enumerate(rc_numbers)]
+    completed = 0
+    for finished in asyncio.as_completed(tasks):
+        await finished
+        completed += 1
+        if completed == len(rc_numbers):
+            break
+        
+        progress_lines = [line if line else f"⏳ {rc}" for line, rc in zip(results, rc_numbers)]
+        try:
+            await context.bot.edit_message_text(
+                f"📊 *BATCH PROCESSING*\n\n"
+                f"Progress: {completed}/{len(rc_numbers)}\n\n"
+                + "\n".join(progress_lines),
+                chat_id=processing_msg.chat_id,
+                message_id=processing_msg.message_id,
+                parse_mode='Markdown',
+                rate_limit_args=SEND_PRIORITY_BULK
+            )
+        except BadRequest as e:
+            logger.warning(f"Batch progress update skipped: {str(e)}")
     
     # Send summary
     summary = "📊 *BATCH PROCESSING COMPLETE*\n\n"
@@ -1008,13 +2734,11 @@ async def handle_batch_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         parse_mode='Markdown'
     )
     
-    for rc in rc_numbers:
-        if bot_instance.validate_rc_number(rc):
-            cached = bot_instance.get_cached_response(rc)
-            if cached:
-                formatted = bot_instance.format_intel_message(cached)
-                await update.message.reply_text(formatted, parse_mode='Markdown')
-                await asyncio.sleep(1)
+    # Reuse the reports from the lookup pass instead of re-reading the cache;
+    # the send scheduler paces these behind interactive replies
+    for report in reports:
+        if report:
+            await reply_chunks(update.message, bot_instance.render_report(report), priority=SEND_PRIORITY_BULK)
     
     return ConversationHandler.END
 
@@ -1026,7 +2750,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if query.data == "single_lookup":
         # Check quota
-        has_quota, remaining = bot_instance.check_user_quota(user.id)
+        has_quota, remaining = await bot_instance.check_user_quota(user.id)
         if not has_quota:
             await query.edit_message_text(
                 "⚠️ *DAILY LIMIT REACHED*\n\n"
@@ -1046,7 +2770,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return WAITING_RC
     
     elif query.data == "batch_mode":
-        has_quota, remaining = bot_instance.check_user_quota(user.id)
+        has_quota, remaining = await bot_instance.check_user_quota(user.id)
         if not has_quota:
             await query.edit_message_text(
                 "⚠️ Daily limit reached!",
@@ -1062,7 +2786,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return BATCH_MODE
     
     elif query.data == "user_stats":
-        stats = bot_instance.get_user_stats(user.id)
+        stats = await bot_instance.get_user_stats(user.id)
         if not stats:
             await query.edit_message_text(
                 "📈 No statistics available yet. Start by looking up a vehicle!",
@@ -1165,6 +2889,26 @@ Need more help? Send /help
             parse_mode='Markdown',
             reply_markup=reply_markup
         )
+    
+    elif query.data == "admin_refresh":
+        if user.id not in ADMIN_IDS:
+            return
+        
+        stats, feedback_list, age = await bot_instance.get_admin_dashboard()
+        chunks = split_message(render_admin_dashboard(stats, feedback_list, age))
+        try:
+            if len(chunks) > 1:
+                await reply_chunks(query.message, chunks, reply_markup=admin_keyboard())
+                await query.message.delete()
+                return
+            await query.edit_message_text(
+                chunks[0],
+                parse_mode='Markdown',
+                reply_markup=admin_keyboard()
+            )
+        except BadRequest as e:
+            # Same snapshot within the same second renders identical text
+            logger.debug(f"Admin refresh not applied: {e}")
 
 async def feedback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle user feedback"""
@@ -1178,7 +2922,7 @@ async def feedback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return WAITING_FEEDBACK
     
     # Save feedback
-    bot_instance.save_feedback(user.id, feedback_text)
+    await bot_instance.save_feedback(user.id, feedback_text)
     
     await update.message.reply_text(
         "✅ *FEEDBACK RECEIVED!*\n\n"
@@ -1198,7 +2942,8 @@ async def feedback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     f"From: {user.first_name} (@{user.username or 'N/A'})\n"
                     f"ID: `{user.id}`\n\n"
                     f"Message:\n{feedback_text}",
-                    parse_mode='Markdown'
+                    parse_mode='Markdown',
+                    rate_limit_args=SEND_PRIORITY_BULK
                 )
             except Exception as e:
                 logger.error(f"Failed to notify admin {admin_id}: {e}")
@@ -1208,7 +2953,7 @@ async def feedback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handler for /stats command"""
     user = update.effective_user
-    stats = bot_instance.get_user_stats(user.id)
+    stats = await bot_instance.get_user_stats(user.id)
     
     if not stats:
         await update.message.reply_text(
@@ -1244,20 +2989,23 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(stats_text, parse_mode='Markdown')
 
-async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handler for /admin command - Admin only"""
-    user = update.effective_user
-    
-    if user.id not in ADMIN_IDS:
-        await update.message.reply_text("⛔ This command is for administrators only.")
-        return
-    
-    # Get admin stats
-    stats = bot_instance.get_admin_stats()
-    feedback_list = bot_instance.get_feedback_list()
-    
+def render_admin_dashboard(stats: Dict[str, Any], feedback_list: List[tuple], age_seconds: float) -> str:
+    """Render the admin dashboard text from a stats snapshot"""
+    upstream = stats['upstream']
+    endpoint_lines = ""
+    for endpoint in upstream['endpoints']:
+        retry_note = f" (retry in {endpoint['retry_in']:.0f}s)" if endpoint['retry_in'] else ""
+        endpoint_lines += (f"• {endpoint['name']}: {endpoint['state']}{retry_note}, {endpoint['error_rate']:.0f}% errors, "
+                           f"{endpoint['latency_ms']:.0f}ms (p95 {endpoint['p95_ms']:.0f}ms)\n")
+    queue_lines = "".join(
+        f"• Queue ({name}): {waits['avg_ms']:.0f}ms avg, {waits['max_ms']:.0f}ms max, "
+        f"{waits['granted']} served, {waits['timeouts']} busy\n"
+        for name, waits in stats['upstream_waits'].items()
+    )
+    top_today = ", ".join(f"{rc} ({count})" for rc, count in stats['top_rcs_today']) or "none yet"
     admin_text = f"""
 👑 *ADMIN DASHBOARD*
+🕐 _Snapshot age: {int(age_seconds)}s (refreshes every {ADMIN_STATS_TTL_SECONDS}s)_
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 📊 *SYSTEM STATISTICS*
@@ -1271,10 +3019,17 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📅 *TODAY'S ACTIVITY*
 • Queries Today: {stats['queries_today']}
 • Active Users: {stats['active_today']}
+• Top Vehicles: {top_today}
 
 💾 *CACHE*
 • Cached Vehicles: {stats['cache_size']}
+• Memory Tier: {stats['memory_cache']['entries']}/{stats['memory_cache']['max_entries']} entries
+• Memory Hit Rate: {stats['memory_cache']['hit_rate']:.1f}% ({stats['memory_cache']['hits']} hits / {stats['memory_cache']['misses']} misses)
+• Evictions: {stats['memory_cache']['evictions']} (+{stats['memory_cache']['expirations']} expired)
 
+🔌 *UPSTREAM*
+{endpoint_lines}• Hedged Requests: {upstream['hedged']}
+{queue_lines}
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
 👥 *TOP 5 USERS*
@@ -1287,25 +3042,88 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     for i, (rc, count) in enumerate(stats['top_rcs'], 1):
         admin_text += f"{i}. {rc} - {count} times\n"
     
+    if stats['live']:
+        live = stats['live']
+        admin_text += "\n⚡ *LIVE (approximate)*\n"
+        admin_text += f"• Active Users Today: ~{live['active_today']}\n"
+        admin_text += "• Hot Vehicles: " + ", ".join(f"{rc} (~{count})" for rc, count in live['top_rcs']) + "\n"
+        admin_text += "• Busiest Users: " + ", ".join(f"`{uid}` (~{count})" for uid, count in live['top_users']) + "\n"
+    
     admin_text += "\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
     admin_text += f"💬 *RECENT FEEDBACK* ({len(feedback_list)} total)\n"
     
     for fid, uid, username, msg, timestamp in feedback_list[:3]:
         admin_text += f"\n• @{username or 'Unknown'}: {msg[:50]}...\n"
     
+    return admin_text
+
+def admin_keyboard() -> InlineKeyboardMarkup:
+    """Inline actions shown under the admin dashboard"""
     keyboard = [
         [InlineKeyboardButton("🔄 Refresh Stats", callback_data="admin_refresh")],
         [InlineKeyboardButton("📊 Export Data", callback_data="admin_export")],
         [InlineKeyboardButton("💬 View Feedback", callback_data="admin_feedback")]
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handler for /admin command - Admin only"""
+    user = update.effective_user
     
-    await update.message.reply_text(
-        admin_text,
-        parse_mode='Markdown',
-        reply_markup=reply_markup
+    if user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ This command is for administrators only.")
+        return
+    
+    # Shared snapshot - concurrent admins do not each recompute the aggregates
+    stats, feedback_list, age = await bot_instance.get_admin_dashboard()
+    
+    await reply_chunks(
+        update.message,
+        split_message(render_admin_dashboard(stats, feedback_list, age)),
+        reply_markup=admin_keyboard()
     )
 
+async def setstatus_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handler for /setstatus command - Admin only"""
+    user = update.effective_user
+    
+    if user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ This command is for administrators only.")
+        return
+    
+    changes = {
+        "premium": {"is_premium": True},
+        "free": {"is_premium": False},
+        "ban": {"is_banned": True},
+        "unban": {"is_banned": False}
+    }
+    
+    args = context.args or []
+    if len(args) != 2 or not args[0].isdigit() or args[1].lower() not in changes:
+        await update.message.reply_text(
+            "⚙️ *Usage:* `/setstatus <user_id> <premium|free|ban|unban>`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    target_id, action = int(args[0]), args[1].lower()
+    if await bot_instance.set_user_status(target_id, **changes[action]):
+        await update.message.reply_text(f"✅ User `{target_id}` updated: *{action}*", parse_mode='Markdown')
+    else:
+        await update.message.reply_text(f"❌ User `{target_id}` not found.", parse_mode='Markdown')
+
+async def backfill_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handler for /backfill_stats command - Admin only"""
+    user = update.effective_user
+    
+    if user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ This command is for administrators only.")
+        return
+    
+    status_msg = await update.message.reply_text("⏳ Rebuilding statistics rollups from query history...")
+    days = await bot_instance.backfill_rollups()
+    await status_msg.edit_text(f"✅ Statistics rollups rebuilt ({days} day(s) of history).")
+
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel conversation"""
     keyboard = [[InlineKeyboardButton("◀️ Back to Menu", callback_data="back_to_menu")]]
@@ -1317,6 +3135,25 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return ConversationHandler.END
 
+async def cache_sweep_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """JobQueue callback that purges expired cache entries"""
+    deleted = await bot_instance.sweep_expired_cache()
+    if deleted:
+        logger.info(f"🧹 Swept {deleted} expired cache entries")
+
+async def quota_flush_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """JobQueue callback that persists the in-memory quota ledger"""
+    await bot_instance.quota_ledger.flush()
+
+async def sketch_persist_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """JobQueue callback that saves the streaming analytics sketches"""
+    await bot_instance.persist_sketches()
+
+async def on_shutdown(application: Application) -> None:
+    """Release shared resources when the application stops"""
+    await bot_instance.close()
+    logger.info("🛑 Shared resources released")
+
 def main():
     """Start the bot with comprehensive error handling"""
     logger.info("🚀 Starting RC Info Bot v3.0...")
@@ -1332,7 +3169,15 @@ def main():
     
     try:
         # Create Application
-        application = Application.builder().token(BOT_TOKEN).build()
+        # Concurrent updates let slow lookups from one chat overlap with others
+        application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .concurrent_updates(CONCURRENT_UPDATES)
+            .rate_limiter(SendScheduler())
+            .post_shutdown(on_shutdown)
+            .build()
+        )
         
         # Conversation handler for lookup
         lookup_conv_handler = ConversationHandler(
@@ -1380,6 +3225,8 @@ def main():
         application.add_handler(CommandHandler("help", help_command))
         application.add_handler(CommandHandler("stats", stats_command))
         application.add_handler(CommandHandler("admin", admin_command))
+        application.add_handler(CommandHandler("setstatus", setstatus_command))
+        application.add_handler(CommandHandler("backfill_stats", backfill_stats_command))
         
         # Add conversation handlers
         application.add_handler(lookup_conv_handler)
@@ -1389,6 +3236,31 @@ def main():
         # Add callback query handler for other buttons
         application.add_handler(CallbackQueryHandler(button_handler))
         
+        # Schedule background maintenance
+        if application.job_queue:
+            application.job_queue.run_repeating(
+                cache_sweep_job,
+                interval=CACHE_SWEEP_INTERVAL_SECONDS,
+                first=60,
+                name="cache_sweeper"
+            )
+            if bot_instance.quota_ledger:
+                application.job_queue.run_repeating(
+                    quota_flush_job,
+                    interval=QUOTA_FLUSH_INTERVAL_SECONDS,
+                    first=QUOTA_FLUSH_INTERVAL_SECONDS,
+                    name="quota_flusher"
+                )
+            if bot_instance.sketches:
+                application.job_queue.run_repeating(
+                    sketch_persist_job,
+                    interval=SKETCH_PERSIST_INTERVAL_SECONDS,
+                    first=SKETCH_PERSIST_INTERVAL_SECONDS,
+                    name="sketch_persister"
+                )
+        else:
+            logger.warning("⚠️ JobQueue unavailable - expired cache entries will not be swept")
+        
         # Start bot
         logger.info("✅ RC Info Bot v3.0 is now running!")
         logger.info("━" * 50)
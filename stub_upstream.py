@@ -0,0 +1,93 @@
+"""
+Stub vehicle lookup server for local testing of the upstream pool.
+
+Serves the same /lookup?rc=... shape as the real API, with injectable
+latency and failures. Run several on different ports and point the bot at
+them:
+
+    python stub_upstream.py --port 8081
+    python stub_upstream.py --port 8082 --latency 3 --error-rate 0.5
+    UPSTREAM_ENDPOINTS="http://127.0.0.1:8081/lookup?rc=,http://127.0.0.1:8082/lookup?rc=" python bot.py
+"""
+
+import argparse
+import asyncio
+import random
+
+from aiohttp import web
+
+
+def fake_report(rc: str) -> dict:
+    """A plausible upstream payload for an RC number"""
+    return {
+        "registration_number": rc,
+        "Ownership Details": {
+            "Owner Name": "TEST OWNER",
+            "Father's Name": "TEST PARENT",
+            "Owner Serial No": "1",
+            "Registration Number": rc,
+            "Registered RTO": "PUNE, Maharashtra"
+        },
+        "Vehicle Details": {
+            "Model Name": "SWIFT DZIRE VXI",
+            "Maker Model": "MARUTI SUZUKI INDIA LTD",
+            "Vehicle Class": "Motor Car(LMV)",
+            "Fuel Type": "PETROL"
+        },
+        "Insurance Information": {
+            "Insurance Company": "STUB INSURANCE CO.",
+            "Insurance Upto": "01-May-2030"
+        },
+        "Important Dates & Validity": {
+            "Registration Date": "12-Jan-2015",
+            "Fitness Upto": "11-Jan-2030"
+        },
+        "Other Information": {
+            "Blacklist Status": "No"
+        },
+        "Basic Card Info": {},
+        "Insurance Alert": {}
+    }
+
+
+def build_app(latency: float, jitter: float, error_rate: float, error_status: int, retry_after: int) -> web.Application:
+    """Application answering /lookup with injected latency and errors"""
+    async def lookup(request: web.Request) -> web.Response:
+        await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+        if random.random() < error_rate:
+            headers = {"Retry-After": str(retry_after)} if error_status == 429 and retry_after else {}
+            return web.json_response({"error": "injected failure"}, status=error_status, headers=headers)
+
+        rc = request.query.get("rc", "").upper()
+        if not rc:
+            return web.json_response({"error": "rc is required"}, status=404)
+        return web.json_response(fake_report(rc))
+
+    app = web.Application()
+    app.router.add_get("/lookup", lookup)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub vehicle lookup upstream")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.2, help="base response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="random +/- added to the delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail, 0..1")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected failures")
+    parser.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds sent with injected 429s")
+    args = parser.parse_args()
+
+    print(f"🧪 Stub upstream on http://127.0.0.1:{args.port}/lookup?rc= "
+          f"(latency {args.latency}s ±{args.jitter}s, {args.error_rate:.0%} errors as HTTP {args.error_status})")
+    web.run_app(
+        build_app(args.latency, args.jitter, args.error_rate, args.error_status, args.retry_after),
+        host="127.0.0.1",
+        port=args.port,
+        print=None
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# bot.py lives at the repository root, which bare `pytest` does not put on sys.path
+REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture
+def bot_module(tmp_path, monkeypatch):
+    """Import bot with its database and log file kept inside tmp_path"""
+    pytest.importorskip("telegram")
+    pytest.importorskip("aiohttp")
+    monkeypatch.chdir(tmp_path)
+    import bot
+    return bot
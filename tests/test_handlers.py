@@ -0,0 +1,160 @@
+"""
+Drive the Telegram handlers through a real ExtBot whose HTTP layer is faked,
+so every call the handlers make is checked against python-telegram-bot's
+actual method signatures.
+"""
+
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+telegram = pytest.importorskip("telegram")
+from telegram import Update
+from telegram.ext import Application, CallbackContext
+from telegram.request import BaseRequest
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Answers Bot API calls locally and records them"""
+
+    def __init__(self):
+        self.calls = []
+        self._message_id = 1000
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls.append((endpoint, params))
+
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bot", "username": "rc_test_bot"}
+        elif endpoint in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            result = {
+                "message_id": params.get("message_id", self._message_id),
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": params["chat_id"], "type": "private"},
+                "text": params["text"]
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def sample_payload(rc: str) -> dict:
+    return {
+        "Ownership Details": {"Owner Name": "TEST OWNER", "Registration Number": rc},
+        "Vehicle Details": {"Model Name": "SWIFT DZIRE VXI"}
+    }
+
+
+def message_update(app, user_id: int, text: str, update_id: int = 1) -> Update:
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.now().timestamp()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test", "username": "tester"},
+            "text": text
+        }
+    }, app.bot)
+
+
+def callback_update(app, user_id: int, data: str) -> Update:
+    return Update.de_json({
+        "update_id": 2,
+        "callback_query": {
+            "id": "cb1",
+            "chat_instance": "ci",
+            "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "message": {
+                "message_id": 77,
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "old dashboard"
+            }
+        }
+    }, app.bot)
+
+
+@pytest.fixture
+def run_handler(bot_module, monkeypatch):
+    """Run a handler against a fresh application; returns the recorded Bot API calls"""
+    async def fake_query(rc_number, use_cache=True, priority=None, deadline=None):
+        return bot_module.bot_instance.parse_intel_data(sample_payload(rc_number), rc_number)
+
+    monkeypatch.setattr(bot_module.bot_instance, "query_rc_api", fake_query)
+
+    def run(handler, make_update):
+        request = FakeTelegramRequest()
+        app = (
+            Application.builder()
+            .token("123:TEST")
+            .request(request)
+            .get_updates_request(FakeTelegramRequest())
+            .rate_limiter(bot_module.SendScheduler(global_rate=1000, chat_rate=1000, chat_burst=1000))
+            .build()
+        )
+
+        async def main():
+            await app.initialize()
+            try:
+                update = make_update(app)
+                await handler(update, CallbackContext.from_update(update, app))
+            finally:
+                await app.shutdown()
+
+        asyncio.run(main())
+        return request.calls
+
+    return run
+
+
+def sent_texts(calls):
+    return [params["text"] for endpoint, params in calls if endpoint == "sendMessage"]
+
+
+def test_admin_command_sends_dashboard(bot_module, run_handler):
+    admin_id = bot_module.ADMIN_IDS[0]
+    calls = run_handler(bot_module.admin_command, lambda app: message_update(app, admin_id, "/admin"))
+
+    texts = sent_texts(calls)
+    assert texts and "ADMIN DASHBOARD" in texts[0]
+
+
+def test_admin_refresh_sends_long_dashboard_in_chunks(bot_module, run_handler, monkeypatch):
+    monkeypatch.setattr(bot_module, "render_admin_dashboard", lambda *args: "dashboard line\n" * 600)
+    admin_id = bot_module.ADMIN_IDS[0]
+    calls = run_handler(bot_module.button_handler, lambda app: callback_update(app, admin_id, "admin_refresh"))
+
+    assert len(sent_texts(calls)) == 3
+    assert ("deleteMessage", {"chat_id": admin_id, "message_id": 77}) in calls
+
+
+def test_single_lookup_sends_every_chunk(bot_module, run_handler, monkeypatch):
+    monkeypatch.setattr(bot_module.bot_instance, "render_report", lambda report: ("part one", "part two"))
+    calls = run_handler(bot_module.handle_rc_input, lambda app: message_update(app, 5001, "MH12AB1234"))
+
+    texts = sent_texts(calls)
+    assert "part one" in texts and "part two" in texts
+    assert not any("ERROR" in text for text in texts)
+
+
+def test_batch_reports_progress_and_results(bot_module, run_handler):
+    calls = run_handler(bot_module.handle_batch_input, lambda app: message_update(app, 5002, "MH12AB1234, DL3CA1234"))
+
+    edits = [params["text"] for endpoint, params in calls if endpoint == "editMessageText"]
+    assert any("Progress: 1/2" in text for text in edits)
+    assert any("BATCH PROCESSING COMPLETE" in text for text in edits)
+    assert sum("RC INFORMATION REPORT" in text for text in sent_texts(calls)) == 2
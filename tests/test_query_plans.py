@@ -0,0 +1,30 @@
+"""
+EXPLAIN QUERY PLAN regression test for the hot SQL statements.
+
+Fails if any statement in QUERY_PLAN_EXPECTATIONS stops using its index
+or falls back to a full table scan.
+"""
+
+import sqlite3
+
+import pytest
+
+@pytest.fixture
+def migrated_conn(bot_module, tmp_path):
+    """A fresh database with the full schema and every migration applied"""
+    conn = sqlite3.connect(tmp_path / "plans.db")
+    bot_module.bot_instance._create_schema(conn)
+    conn.commit()
+    bot_module.bot_instance._run_migrations(conn)
+    yield conn
+    conn.close()
+
+
+def test_hot_queries_use_their_indexes(bot_module, migrated_conn):
+    assert bot_module.bot_instance.check_query_plans(migrated_conn) == []
+
+
+def test_migrations_drop_unused_query_indexes(migrated_conn):
+    indexes = {row[0] for row in migrated_conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert "idx_queries_user_time" in indexes
+    assert not indexes & {"idx_queries_time_user", "idx_queries_rc", "idx_queries_success"}
@@ -0,0 +1,62 @@
+"""
+The template renderer must stay byte-identical to the legacy renderer
+kept in bench_render.py.
+"""
+
+import pytest
+
+
+def sample_payload(rc: str, **overrides) -> dict:
+    """An upstream payload shaped like the real API's"""
+    payload = {
+        "registration_number": rc,
+        "Ownership Details": {
+            "Owner Name": "TEST OWNER",
+            "Father's Name": "TEST PARENT",
+            "Owner Serial No": "1",
+            "Registration Number": rc,
+            "Registered RTO": "PUNE, Maharashtra"
+        },
+        "Vehicle Details": {
+            "Model Name": "SWIFT DZIRE VXI",
+            "Maker Model": "MARUTI SUZUKI INDIA LTD",
+            "Vehicle Class": "Motor Car(LMV)",
+            "Fuel Type": "PETROL"
+        },
+        "Insurance Information": {
+            "Insurance Company": "TEST INSURANCE CO.",
+            "Insurance Upto": "01-May-2030"
+        },
+        "Important Dates & Validity": {
+            "Registration Date": "12-Jan-2015",
+            "Fitness Upto": "11-Jan-2030"
+        },
+        "Other Information": {
+            "Blacklist Status": "No"
+        },
+        "Basic Card Info": {},
+        "Insurance Alert": {}
+    }
+    payload.update(overrides)
+    return payload
+
+
+@pytest.fixture
+def reports(bot_module):
+    parse = bot_module.bot_instance.parse_intel_data
+    full = parse(sample_payload("MH12AB1234"), "MH12AB1234")
+    sparse = parse(sample_payload("DL3CAB1", **{
+        "Insurance Information": {},
+        "Other Information": {"Blacklist Status": "Yes"},
+        "Ownership Details": {"Registered RTO": "N/A"}
+    }), "DL3CAB1")
+    cached = parse(sample_payload("KA01A1"), "KA01A1")
+    cached["metadata"] = {**cached["metadata"], "from_cache": True, "stale": True}
+    return [full, sparse, cached, {"error": "API timeout"}]
+
+
+def test_renderer_matches_legacy(bot_module, reports):
+    from bench_render import legacy_format_intel_message
+    
+    for report in reports:
+        assert bot_module.bot_instance.format_intel_message(report) == legacy_format_intel_message(report)
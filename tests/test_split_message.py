@@ -0,0 +1,41 @@
+"""
+split_message must keep every chunk within the limit and every Markdown
+entity balanced inside its chunk.
+"""
+
+
+def open_entity(bot_module, chunk: str) -> str:
+    """The entity still open at the end of chunk, "" if balanced"""
+    marker = ""
+    for _end, marker in bot_module._markdown_tokens(chunk):
+        pass
+    return marker
+
+
+def test_code_block_across_chunk_edge(bot_module):
+    text = (
+        "intro line\n" + "x" * 50 + "\n```\n"
+        + "\n".join(f"code line {i}" for i in range(30))
+        + "\n```\nafter *bold* text"
+    )
+    for limit in (60, 100, 200, 300):
+        chunks = bot_module.split_message(text, limit)
+        assert len(chunks) > 1
+        for chunk in chunks:
+            assert bot_module.telegram_length(chunk) <= limit
+            assert open_entity(bot_module, chunk) == ""
+
+
+def test_code_block_kept_whole_when_it_fits(bot_module):
+    block = "```\n" + "\n".join(f"line {i}" for i in range(5)) + "\n```"
+    text = "a" * 70 + "\n" + block + "\nafter"
+    chunks = bot_module.split_message(text, 100)
+    assert chunks == ("a" * 70, block + "\nafter")
+
+
+def test_long_inline_code_is_reopened(bot_module):
+    chunks = bot_module.split_message("`" + "y" * 1000 + "`", 100)
+    assert "".join(chunk.strip("`") for chunk in chunks) == "y" * 1000
+    for chunk in chunks:
+        assert bot_module.telegram_length(chunk) <= 100
+        assert chunk.startswith("`") and chunk.endswith("`")
@@ -0,0 +1,43 @@
+"""
+Queued upstream waiters that go away must not consume rate-limit tokens.
+"""
+
+import asyncio
+import time
+
+
+def test_cancelled_waiter_does_not_take_a_token(bot_module):
+    async def scenario():
+        scheduler = bot_module.UpstreamScheduler(bot_module.TokenBucket(1, 1))
+        assert await scheduler.acquire(bot_module.UPSTREAM_PRIORITY_FREE, 5)
+        
+        cancelled = asyncio.create_task(scheduler.acquire(bot_module.UPSTREAM_PRIORITY_FREE, 5))
+        await asyncio.sleep(0.1)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert not scheduler._waiters
+        
+        started = time.monotonic()
+        assert await scheduler.acquire(bot_module.UPSTREAM_PRIORITY_FREE, 5)
+        return time.monotonic() - started
+
+    # One token per second: the next grant is due about 0.9s later, not a full second after that
+    assert asyncio.run(scenario()) < 1.5
+
+
+def test_settled_waiter_is_skipped_by_the_pump(bot_module):
+    async def scenario():
+        scheduler = bot_module.UpstreamScheduler(bot_module.TokenBucket(1, 1))
+        assert await scheduler.acquire(bot_module.UPSTREAM_PRIORITY_FREE, 5)
+        
+        abandoned = asyncio.create_task(scheduler.acquire(bot_module.UPSTREAM_PRIORITY_FREE, 5))
+        await asyncio.sleep(0.1)
+        scheduler._waiters[0][2].cancel()
+        
+        started = time.monotonic()
+        granted = await scheduler.acquire(bot_module.UPSTREAM_PRIORITY_BATCH, 5)
+        return granted, time.monotonic() - started, await abandoned
+
+    granted, waited, abandoned_result = asyncio.run(scenario())
+    assert granted and waited < 1.5
+    assert abandoned_result is False